@@ -32,8 +32,15 @@
 
 from random import random
 from pacman import Directions
+from game import Actions
 import util
 
+# numpy is only needed by GhostTransitionTable
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 #
 # Parameters
 #
@@ -83,8 +90,32 @@ def ghosts(state):
     # This version just returns the ghost positions from the state data
     # In later versions this will be more restricted, and include some
     # uncertainty.
-            
-    return state.getGhostPositions()
+    #
+    # With partialVisibility, only the ghosts that are visible or
+    # audible are returned.
+
+    return [s.getPosition() for s in noticedGhostStates(state)]
+
+def noticedGhostStates(state):
+    # Returns the states of the ghosts that Pacman knows about, in the
+    # order of the ghost agents. With partialVisibility these are the
+    # ghosts that are visible or audible, otherwise all of them.
+    #
+    # ghosts(), ghostStates(), ghostStatesWithTimes() and
+    # ghostDirections() all list these ghosts, in this order.
+
+    ghostStateInfo = state.getGhostStates()
+    if not partialVisibility:
+        return ghostStateInfo
+    positions = [s.getPosition() for s in ghostStateInfo]
+    noticed = union(visible(positions, state), audible(positions, state))
+    return [s for s in ghostStateInfo if s.getPosition() in noticed]
+
+def ghostCount(state):
+    # Returns the number of ghosts in the game, whether or not Pacman
+    # knows where they are.
+
+    return len(state.getGhostStates())
 
 def ghostStates(state):
     # Returns the position of the ghsosts, plus an indication of
@@ -97,7 +128,7 @@ def ghostStates(state):
     # where "state" is 1 if the relevant ghost is scared/edible, and 0
     # otherwise.
     
-    ghostStateInfo = state.getGhostStates()
+    ghostStateInfo = noticedGhostStates(state)
     ghostStates = []
     for s in ghostStateInfo:
         if s.scaredTimer > 0:
@@ -111,12 +142,20 @@ def ghostStatesWithTimes(state):
     # mode, "state" is a time value (how much longer the ghost will
     # remain scared/edible) rather than 1.
     
-    ghostStateInfo = state.getGhostStates()
+    ghostStateInfo = noticedGhostStates(state)
     ghostStates = []
     for s in ghostStateInfo:
         ghostStates.append((s.getPosition(), s.scaredTimer))
     return ghostStates
 
+def ghostDirections(state):
+    # Returns the direction each ghost is moving in, for the same
+    # ghosts and in the same order as ghosts(). Ghosts cannot turn back
+    # unless they are in a dead end, so this says where they can go
+    # next.
+
+    return [s.getDirection() for s in noticedGhostStates(state)]
+
 def capsules(state):
     # Returns a list of (x, y) pairs of capsule positions.
     #
@@ -133,7 +172,7 @@ def capsules(state):
     #
     # In both cases, walls block the view.
     
-    return state.getCapsules()
+    return visible(state.getCapsules(), state)
 
 def food(state):
     # Returns a list of (x, y) pairs of food positions
@@ -151,17 +190,11 @@ def food(state):
     #
     # In both cases, walls block the view.
     
-    foodList= []
-    foodGrid = state.getFood()
-    width = foodGrid.width
-    height = foodGrid.height
-    for i in range(width):
-        for j in range(height):
-            if foodGrid[i][j] == True:
-                foodList.append((i, j))
-            
+    # In the order of a column-by-column scan of the map
+    foodList = state.getFood().asList()
+
     # Return list of food that is visible
-    return foodList
+    return visible(foodList, state)
 
 def walls(state):
     # Returns a list of (x, y) pairs of wall positions
@@ -214,31 +247,297 @@ def makeMove(direction, legal):
     # deciding what Pacman does:
     if direction == Directions.STOP:
         return direction
-    
+
+    # Sample a move from the motion model. The intended move comes
+    # first, so it is made whenever sample <= directionProb.
+    sample = random()
+    outcomes = motionModel(direction, legal)
+    for move, probability in outcomes:
+        if sample <= probability:
+            return move
+        sample -= probability
+    # Only reached through rounding in the subtractions above
+    return outcomes[-1][0]
+
+def motionModel(direction, legal, prob=None):
+    # Returns the moves that Pacman may actually make when trying to
+    # move in the specified direction, as a list of (move, probability)
+    # pairs.
+    #
+    # The intended move comes first, then the moves to its left and
+    # right. A move that is not legal, for example because there is a
+    # wall in the way, is replaced by Directions.STOP since Pacman
+    # stays in the same place. Such moves are not merged, so the list
+    # always has the same length for a given direction.
+    #
+    # Both makeMove() and TransitionTable use this, so the moves that
+    # Pacman makes and the model that agents plan with always agree.
+    #
+    # prob defaults to directionProb.
+    if prob == None:
+        prob = directionProb
+    if direction == Directions.STOP:
+        return [(Directions.STOP, 1.0)]
+    moves = [direction]
+    probs = [1.0]
     if nonDeterministic:
-        # Sample in the usual way to make Pacman move in the specified
-        # direction with probability directionProb.
-        #
-        # Otherwise make a different move.
-        sample = random()
-        if sample <= directionProb:
-            # Here the non-deterministic action selection says to
-            # return the original move, but we need to check it is
-            # legal in case we were passed an illegal action (because,
-            # for example, that was the MEU action).
-            #
-            # If the specified action is not legal, in this case we
-            # will not move.
-            if direction in legal:
-                return direction
-            else:
-                return Directions.STOP
+        moves = [direction, Directions.LEFT[direction], Directions.RIGHT[direction]]
+        probs = [prob, (1 - prob)/2, (1 - prob)/2]
+    outcomes = []
+    for i in range(len(moves)):
+        if moves[i] in legal:
+            outcomes.append((moves[i], probs[i]))
         else:
-            return selectNewMove(direction, legal)
-    else:
-        # When actions are deterministic, Pacman moves in the
-        # specified direction
-        return direction
+            outcomes.append((Directions.STOP, probs[i]))
+    return outcomes
+
+def transitionTable(state, prob=None):
+    # Returns the TransitionTable for the layout of the current game.
+    #
+    # Tables are built once per layout and motion model, and then
+    # reused for every game played on that layout.
+    if prob == None:
+        prob = directionProb
+    wallGrid = state.getWalls()
+    key = (str(wallGrid), prob, nonDeterministic)
+    if key not in _transitionTables:
+        _transitionTables[key] = TransitionTable(wallGrid, prob)
+    return _transitionTables[key]
+
+_transitionTables = {}
+
+class TransitionTable:
+    # The motion model of motionModel(), worked out in advance for
+    # every cell that Pacman can be in.
+    #
+    # Cells are numbered x * height + y, which is the order of a
+    # column-by-column scan of the map. For a cell (x, y) that is not
+    # a wall:
+    #
+    # table.successors[(x, y)][direction]
+    #
+    # is the list of ((x', y'), probability) pairs for the cells that
+    # Pacman may end up in when trying to move in direction, in the
+    # order given by motionModel(). Moves into walls leave Pacman in
+    # (x, y). The same information is held by cell number in
+    #
+    # table.indices[direction][cell], table.probs[direction][cell]
+    #
+    # which are lists over every cell of the map. Wall cells have no
+    # successors.
+
+    def __init__(self, wallGrid, prob=None):
+        self.width = wallGrid.width
+        self.height = wallGrid.height
+        self.successors = {}
+        self.indices = {}
+        self.probs = {}
+        directions = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+        for direction in directions:
+            self.indices[direction] = [[] for i in range(self.width * self.height)]
+            self.probs[direction] = [[] for i in range(self.width * self.height)]
+        for x in range(self.width):
+            for y in range(self.height):
+                if wallGrid[x][y]:
+                    continue
+                legal = [d for d in directions if self.isFree(wallGrid, self.neighbour((x, y), d))]
+                self.successors[(x, y)] = {}
+                for direction in directions:
+                    outcomes = []
+                    for move, probability in motionModel(direction, legal, prob):
+                        outcomes.append((self.neighbour((x, y), move), probability))
+                    self.successors[(x, y)][direction] = outcomes
+                    self.indices[direction][self.index((x, y))] = [self.index(c) for c, p in outcomes]
+                    self.probs[direction][self.index((x, y))] = [p for c, p in outcomes]
+
+    def index(self, cell):
+        # The number of a cell.
+        return int(cell[0]) * self.height + int(cell[1])
+
+    def neighbour(self, cell, direction):
+        # The cell next to cell in the given direction.
+        dx, dy = Actions.directionToVector(direction)
+        return (cell[0] + int(dx), cell[1] + int(dy))
+
+    def isFree(self, wallGrid, cell):
+        # True if the cell is on the map and is not a wall.
+        x, y = int(cell[0]), int(cell[1])
+        return 0 <= x < self.width and 0 <= y < self.height and not wallGrid[x][y]
+
+def corridorGraph(state):
+    # Returns the CorridorGraph for the layout of the current game,
+    # built once per layout like transitionTable().
+    wallGrid = state.getWalls()
+    key = str(wallGrid)
+    if key not in _corridorGraphs:
+        _corridorGraphs[key] = CorridorGraph(wallGrid)
+    return _corridorGraphs[key]
+
+_corridorGraphs = {}
+
+class CorridorGraph:
+    # The maze as a graph of junctions joined by corridors.
+    #
+    # Nodes are the free cells that do not have exactly two free
+    # neighbours: junctions, dead ends and open areas. A corridor is
+    # a run of cells with two free neighbours each, and
+    #
+    # graph.edges
+    #
+    # is a list of (node, path) pairs, one for each way out of each
+    # node, where path lists the cells walked through in order and
+    # ends with the node reached. Every corridor appears twice, once
+    # from each end. Cells are numbered as in TransitionTable, and
+    # graph.nodes is the sorted list of node cells.
+    #
+    # A ring of corridor with no junction on it gets one of its cells
+    # made into a node.
+
+    def __init__(self, wallGrid):
+        self.width = wallGrid.width
+        self.height = wallGrid.height
+        self.free = []
+        self.neighbours = {}
+        directions = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+        for x in range(self.width):
+            for y in range(self.height):
+                if wallGrid[x][y]:
+                    continue
+                cell = x * self.height + y
+                self.free.append(cell)
+                self.neighbours[cell] = []
+                for direction in directions:
+                    dx, dy = Actions.directionToVector(direction)
+                    nx, ny = x + int(dx), y + int(dy)
+                    if 0 <= nx < self.width and 0 <= ny < self.height and not wallGrid[nx][ny]:
+                        self.neighbours[cell].append(nx * self.height + ny)
+
+        nodes = set(c for c in self.free if len(self.neighbours[c]) != 2)
+        self.edges = []
+        visited = set(nodes)
+        for node in sorted(nodes):
+            self.trace(node, nodes, visited)
+        for cell in self.free:
+            if cell not in visited:
+                nodes.add(cell)
+                visited.add(cell)
+                self.trace(cell, nodes, visited)
+        self.nodes = sorted(nodes)
+
+    def trace(self, node, nodes, visited):
+        # Follows each corridor out of node until it reaches a node.
+        for first in self.neighbours[node]:
+            path = [first]
+            previous = node
+            while path[-1] not in nodes:
+                visited.add(path[-1])
+                step = [c for c in self.neighbours[path[-1]] if c != previous]
+                previous = path[-1]
+                path.append(step[0])
+            self.edges.append((node, path))
+
+def ghostTransitionTable(state):
+    # Returns the GhostTransitionTable for the layout of the current
+    # game, built once per layout like transitionTable().
+    wallGrid = state.getWalls()
+    key = str(wallGrid)
+    if key not in _ghostTransitionTables:
+        _ghostTransitionTables[key] = GhostTransitionTable(wallGrid)
+    return _ghostTransitionTables[key]
+
+_ghostTransitionTables = {}
+
+class GhostTransitionTable:
+    # Where a ghost may be after one move, for each cell and heading.
+    #
+    # Ghosts never stop, and only turn back in a dead end, so where a
+    # ghost can go depends on the way it is heading as well as its
+    # cell. States are numbered cell * 5 + heading, with cells
+    # numbered as in TransitionTable and headings in the order of
+    # table.headings (the four directions, then STOP for a ghost that
+    # has not moved yet).
+    #
+    # Each move is an entry (row, col, prob): from state row to state
+    # col with probability prob, so a distribution over states is
+    # moved on by step(). There are two sets of entries:
+    #
+    # - the RandomGhost ones, any legal move equally likely.
+    #
+    # - the DirectionalGhost ones. A DirectionalGhost takes the moves
+    # that bring it closest to Pacman (furthest when scared) with
+    # probability 0.8. Which moves those are only depends on whether
+    # Pacman is left of, level with or right of the ghost, and below,
+    # level with or above it, so there is a set of entries for each
+    # of those 9 cases (key = 3 * (sign dx + 1) + sign dy + 1), scared
+    # or not.
+
+    headings = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+
+    def __init__(self, wallGrid):
+        self.width = wallGrid.width
+        self.height = wallGrid.height
+        self.states = self.width * self.height * 5
+        randomEntries = []
+        directionalEntries = []
+        for x in range(self.width):
+            for y in range(self.height):
+                if wallGrid[x][y]:
+                    continue
+                exits = []
+                for direction in self.headings[:4]:
+                    dx, dy = Actions.directionToVector(direction)
+                    nx, ny = x + int(dx), y + int(dy)
+                    if 0 <= nx < self.width and 0 <= ny < self.height and not wallGrid[nx][ny]:
+                        exits.append((direction, nx, ny))
+                for h, heading in enumerate(self.headings):
+                    row = (x * self.height + y) * 5 + h
+                    legal = [e for e in exits if e[0] != Directions.REVERSE[heading]] or exits
+                    cols = [(nx * self.height + ny) * 5 + self.headings.index(d) for d, nx, ny in legal]
+                    for col in cols:
+                        randomEntries.append((row, col, 1.0 / len(legal)))
+                    for sx in [-1, 0, 1]:
+                        for sy in [-1, 0, 1]:
+                            # A Pacman far off in the given direction
+                            pacman = (x + 1000 * sx, y + 1000 * sy)
+                            distances = [util.manhattanDistance((nx, ny), pacman) for d, nx, ny in legal]
+                            for scared in [0, 1]:
+                                if scared: best = max(distances)
+                                else: best = min(distances)
+                                count = distances.count(best)
+                                for col, distance in zip(cols, distances):
+                                    prob = 0.8 * (distance == best) / count + 0.2 / len(legal)
+                                    directionalEntries.append((row, col, prob, 3 * (sx + 1) + sy + 1, scared))
+        rows, cols, probs = zip(*randomEntries)
+        self.randomRows, self.randomCols, self.randomProbs = np.array(rows), np.array(cols), np.array(probs)
+        rows, cols, probs, keys, scared = zip(*directionalEntries)
+        self.rows, self.cols, self.probs = np.array(rows), np.array(cols), np.array(probs)
+        self.keys, self.scared = np.array(keys), np.array(scared, dtype=bool)
+        self.rowX = self.rows // 5 // self.height
+        self.rowY = self.rows // 5 % self.height
+
+    def state(self, cell, heading):
+        # The number of the state of a ghost in cell, heading heading.
+        return (int(cell[0]) * self.height + int(cell[1])) * 5 + self.headings.index(heading)
+
+    def moves(self, pacman=None, scared=False):
+        # The (rows, cols, probs) entries of a RandomGhost, or of a
+        # DirectionalGhost if pacman's position is given.
+        if pacman == None:
+            return self.randomRows, self.randomCols, self.randomProbs
+        keys = 3 * (np.sign(pacman[0] - self.rowX) + 1) + np.sign(pacman[1] - self.rowY) + 1
+        use = (keys == self.keys) & (self.scared == scared)
+        return self.rows[use], self.cols[use], self.probs[use]
+
+    def step(self, where, moves):
+        # Moves the distribution where over states on by one move,
+        # made with the entries given by moves().
+        rows, cols, probs = moves
+        return np.bincount(cols, weights=probs * where[rows], minlength=self.states)
+
+    def cells(self, where):
+        # The probability of being in each cell, from a distribution
+        # over states.
+        return where.reshape(-1, 5).sum(axis=1)
 
 #
 # Details that you don't need to look at if you don't want to.
@@ -402,6 +701,35 @@ def visible(objects, state):
             visibleObjects = distanceLimited(visibleObjects, state, visibilityLimit)
         return visibleObjects
 
+def visibleCells(state):
+    # Returns the list of cells that Pacman can see, by the same rules
+    # as visible(): those in front up to visibilityLimit away and
+    # those to the side up to sideLimit away, or in every direction
+    # up to visibilityLimit when Pacman is not moving. Walls block the
+    # view.
+    #
+    # Returns None if partialVisibility is False, since then Pacman
+    # can see everything.
+
+    if not partialVisibility:
+        return None
+    pacman = state.getPacmanPosition()
+    facing = state.getPacmanState().configuration.direction
+    if facing == Directions.STOP:
+        rays = [(d, visibilityLimit) for d in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]]
+    else:
+        rays = [(facing, visibilityLimit), (Directions.LEFT[facing], sideLimit), (Directions.RIGHT[facing], sideLimit)]
+    cells = []
+    for direction, limit in rays:
+        dx, dy = Actions.directionToVector(direction)
+        x, y = int(pacman[0]), int(pacman[1])
+        for step in range(limit):
+            x, y = x + int(dx), y + int(dy)
+            if state.hasWall(x, y):
+                break
+            cells.append((x, y))
+    return cells
+
 def audible(ghosts, state):
     # A ghost is audible if it is any direction and less than
     # "hearingLimit" away.
@@ -414,70 +742,3 @@ def union(a, b):
     # From https://www.saltycrane.com/blog/2008/01/how-to-find-intersection-and-union-of/
     #
     return list(set(a) | set(b))
-
-def selectNewMove(direction, legal):
-    # This function is called if Pacman isn't moving in the specified
-    # direction. Need to pick another legal action.
-
-    # Pick with 50% probability between the two perpendicular
-    # possibilities.
-    sample = random()
-    if sample <= 0.5:
-        left = True
-    else:
-        left = False
-
-    # If chosen direction is North, then pick between West (left) and
-    # East. If these moves are legal, make them, otherwise don't move.
-    if direction == Directions.NORTH:
-        if left:
-            if Directions.WEST in legal:
-                return Directions.WEST
-            else:
-                return Directions.STOP
-        else:
-              if Directions.EAST in legal:
-                return Directions.EAST
-              else:
-                return Directions.STOP
-
-    # If chosen direction is EAST
-    if direction == Directions.EAST:
-        if left:
-            if Directions.NORTH in legal:
-                return Directions.NORTH
-            else:
-                return Directions.STOP
-        else:
-              if Directions.SOUTH in legal:
-                return Directions.SOUTH
-              else:
-                return Directions.STOP
-
-    # If chosen direction is SOUTH
-    if direction == Directions.SOUTH:
-        if left:
-            if Directions.EAST in legal:
-                return Directions.EAST
-            else:
-                return Directions.STOP
-        else:
-              if Directions.WEST in legal:
-                return Directions.WEST
-              else:
-                return Directions.STOP
-  
-    # If chosen direction is WEST
-    if direction == Directions.WEST:
-        if left:
-            if Directions.SOUTH in legal:
-                return Directions.SOUTH
-            else:
-                return Directions.STOP
-        else:
-              if Directions.NORTH in legal:
-                return Directions.NORTH
-              else:
-                return Directions.STOP
-
-    print "Why am I here?"
@@ -0,0 +1,384 @@
+# benchmark.py
+# ------------
+# Timing harness for the solvers in mdpAgents.py.
+#
+# Plays one game on each layout to collect the states Pacman sees, then
+# has each agent configuration choose a move in every one of those
+# states, reporting sweeps, time and how often it picks the same move as
+# the first configuration.
+#
+# The code runs on top of the PacMan AI projects from:
+#
+# http://ai.berkeley.edu/
+#
+# As required by the licensing agreement for the PacMan AI we have:
+#
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+USAGE:      python benchmark.py <benchmark> <options>
+EXAMPLES:   (1) python benchmark.py solvers
+                - compares value, policy and modified policy iteration on
+                  smallGrid, mediumClassic and originalClassic
+            (2) python benchmark.py solvers -l mediumClassic -a engine=numpy,discount=0.9
+                - the same at a discount factor of 0.9
+            (3) python benchmark.py prioritized -l originalClassic
+                - warm started value iteration against prioritized sweeping
+            (4) python benchmark.py window -l originalClassic,bigSearch
+                - full value iteration against solving near Pacman only
+            (5) python benchmark.py sweeps -a engine=numpy,stop=residual
+                - Jacobi against Gauss-Seidel sweeps, in scan and distance order
+            (6) python benchmark.py corridor -l mediumClassic,originalClassic,bigMaze
+                - value iteration over every cell against over junctions only
+            (7) python benchmark.py parallel -z 201 -m 3 -w 4
+                - the parallel solver with 1, 2, 3 and 4 workers on a
+                  generated 201 by 201 maze, and its speedup over 1 worker
+            (8) python benchmark.py settings -p discount:0.5:0.7:0.9/ghostReward:-2:-5:-10
+                - solves 9 parameter settings at once on each state, and
+                  reports how often the settings choose the same move
+            (9) python benchmark.py multigrid -l originalClassic -z 101 -a engine=numpy,discount=0.9
+                - cold value iteration against starting from the solves of
+                  1, 2 and 3 coarser copies of the map, on originalClassic
+                  and a generated 101 by 101 maze
+            (10) python benchmark.py successors -l mediumClassic -k 4
+                - time and allocations per GameState.generateSuccessor,
+                  copying every agent state against copy on write
+"""
+
+import sys, gc, time, random, multiprocessing
+import api, layout, pacman, ghostAgents, mdpAgents
+
+BENCHMARKS = {}
+
+# Configurations compared by each benchmark unless -c is given. Each one is
+# a string of agent arguments, in the same format as pacman.py -a
+DEFAULT_CONFIGS = {
+    'solvers': ['solver=value', 'solver=policy', 'solver=modified'],
+    'prioritized': ['solver=value,warmStart=1', 'solver=prioritized'],
+    'window': ['solver=value,warmStart=1', 'window=5,warmStart=1', 'window=10,warmStart=1',
+               'window=auto,warmStart=1'],
+    'corridor': ['solver=value,warmStart=1', 'solver=corridor,warmStart=1',
+                 'solver=value,warmStart=1,stop=residual', 'solver=corridor,warmStart=1,stop=residual'],
+    'settings': [],
+    'successors': [],
+    'parallel': [],
+    'multigrid': ['solver=value', 'multigrid=1', 'multigrid=2', 'multigrid=3'],
+    'sweeps': ['sweep=jacobi', 'sweep=inplace', 'sweep=ordered',
+               'engine=dict,sweep=jacobi', 'engine=dict,sweep=ordered'],
+}
+
+def loadLayout(layoutName):
+    """
+    Returns the layout with the given name, as pacman.py -l finds it.
+    """
+    theLayout = layout.getLayout(layoutName)
+    if theLayout == None: raise Exception("The layout " + layoutName + " cannot be found")
+    return theLayout
+
+def generateMaze(size, numGhosts, seed, loops=0.1, food=0.05):
+    """
+    Generates a size by size layout (size is rounded up to an odd number): a
+    maze dug by a randomised depth first search, with a fraction loops of the
+    remaining inner walls knocked down so that there is more than one way
+    round. A fraction food of the corridor cells have food, with a capsule in
+    each corner and Pacman and the ghosts at random.
+    """
+    size = size | 1
+    rand = random.Random(seed)
+    grid = [['%'] * size for y in range(size)]
+    stack = [(1, 1)]
+    grid[1][1] = ' '
+    while stack:
+        x, y = stack[-1]
+        options = [(dx, dy) for dx, dy in [(0, 2), (0, -2), (2, 0), (-2, 0)]
+                   if 0 < x + dx < size - 1 and 0 < y + dy < size - 1 and grid[y + dy][x + dx] == '%']
+        if not options:
+            stack.pop()
+            continue
+        dx, dy = rand.choice(options)
+        grid[y + dy / 2][x + dx / 2] = ' '
+        grid[y + dy][x + dx] = ' '
+        stack.append((x + dx, y + dy))
+    for y in range(1, size - 1):
+        for x in range(1, size - 1):
+            if grid[y][x] == '%' and (x + y) % 2 == 1 and rand.random() < loops:
+                grid[y][x] = ' '
+    free = [(x, y) for y in range(size) for x in range(size) if grid[y][x] == ' ']
+    for x, y in rand.sample(free, max(1, int(food * len(free)))):
+        grid[y][x] = '.'
+    for x, y in [(1, 1), (1, size - 2), (size - 2, 1), (size - 2, size - 2)]:
+        grid[y][x] = 'o'
+    free = [(x, y) for y in range(size) for x in range(size) if grid[y][x] == ' ']
+    for x, y in rand.sample(free, numGhosts + 1):
+        grid[y][x] = 'G'
+    grid[y][x] = 'P'
+    return layout.Layout([''.join(row) for row in grid])
+
+def recordStates(theLayout, numGhosts, maxMoves, seed, agentArgs):
+    """
+    Plays a game with an MDPAgent and returns the states Pacman moved in,
+    stopping after maxMoves moves so that games that never end (such as
+    Pacman wandering a maze) are cut short.
+    """
+    random.seed(seed)
+    agent = mdpAgents.MDPAgent(**agentArgs)
+    ghosts = [ghostAgents.RandomGhost(i + 1) for i in range(min(numGhosts, theLayout.getNumGhosts()))]
+    state = pacman.GameState()
+    state.initialize(theLayout, len(ghosts))
+    agent.registerInitialState(state)
+    states = []
+    while len(states) < maxMoves and not (state.isWin() or state.isLose()):
+        states.append(state.deepCopy())
+        state = state.generateSuccessor(0, agent.getAction(state))
+        for ghost in ghosts:
+            if state.isWin() or state.isLose(): break
+            state = state.generateSuccessor(ghost.index, ghost.getAction(state))
+    return states
+
+def runAgent(agent, states):
+    """
+    Has the agent choose a move in each state, as it would in a game.
+
+    Returns a list of (move, sweeps, cells updated, seconds) for each state.
+    """
+    agent.registerInitialState(states[0])
+    results = []
+    for state in states:
+        start = time.time()
+        move = agent.chooseMove(state)
+        seconds = time.time() - start
+        # The dict engine does not count single cell updates
+        results.append((move, agent.sweeps, agent.updates or 0, seconds))
+    return results
+
+def compareConfigs(states, configs, agentArgs):
+    """
+    Runs each configuration over the states and prints one line per
+    configuration. Agreement is measured against the first configuration.
+
+    Returns a list of (sweeps, seconds) for each configuration.
+    """
+    print '  %-40s %8s %9s %10s %9s %8s' % ('configuration', 'sweeps', 'per move', 'updates', 'ms', 'agree')
+    reference = None
+    totals = []
+    for config in configs:
+        args = dict(agentArgs)
+        args.update(pacman.parseAgentArgs(config))
+        agent = mdpAgents.MDPAgent(**args)
+        results = runAgent(agent, states)
+        # Games end through final, which these moves never reach
+        agent.stopWorkers()
+        moves = [r[0] for r in results]
+        if reference == None: reference = moves
+        sweeps = sum([r[1] for r in results])
+        updates = sum([r[2] for r in results])
+        seconds = sum([r[3] for r in results])
+        agree = len([1 for a, b in zip(moves, reference) if a == b])
+        print '  %-40s %8d %9.1f %10d %9.1f %4d/%-4d' % (config, sweeps, sweeps / float(len(states)), updates, 1000 * seconds, agree, len(states))
+        totals.append((sweeps, seconds))
+    return totals
+
+def compareOnLayouts(options, configs, agentArgs):
+    """
+    Compares the configurations on the states of a game on each layout.
+    """
+    for layoutName in options.layouts.split(','):
+        states = recordStates(loadLayout(layoutName), options.numGhosts, options.moves, options.seed, agentArgs)
+        print '%s: %d states, discount %s' % (layoutName, len(states), mdpAgents.MDPAgent(**agentArgs).discountFactor)
+        compareConfigs(states, configs, agentArgs)
+
+def compareOnGraphs(options, configs, agentArgs):
+    """
+    As compareOnLayouts, first printing how many states the corridor solver
+    works on in each layout.
+    """
+    for layoutName in options.layouts.split(','):
+        theLayout = loadLayout(layoutName)
+        graph = api.CorridorGraph(theLayout.walls)
+        print '%s: %d cells, %d free, %d junction nodes, %d corridor edges' % (layoutName,
+            theLayout.width * theLayout.height, len(graph.free), len(graph.nodes), len(graph.edges) / 2)
+        states = recordStates(theLayout, options.numGhosts, options.moves, options.seed, agentArgs)
+        print '%s: %d states, discount %s' % (layoutName, len(states), mdpAgents.MDPAgent(**agentArgs).discountFactor)
+        compareConfigs(states, configs, agentArgs)
+
+def compareOnMazes(options, configs, agentArgs):
+    """
+    Compares the configurations on the states of a game on generated mazes of
+    each of the sizes given.
+    """
+    for size in options.sizes.split(','):
+        theLayout = generateMaze(int(size), options.numGhosts, options.seed)
+        states = recordStates(theLayout, options.numGhosts, options.moves, options.seed, agentArgs)
+        print '%dx%d maze: %d states, %d cores' % (theLayout.width, theLayout.height, len(states), multiprocessing.cpu_count())
+        compareConfigs(states, configs, agentArgs)
+
+def compareScaling(options, configs, agentArgs):
+    """
+    As compareOnMazes, by default for value iteration and the parallel
+    solver with 1 to -w workers, then prints the time per sweep of each
+    configuration and its speedup over the first. Solvers take different
+    numbers of sweeps, so the speedup is per sweep. Parallel
+    configurations also get their speedup over the one with 1 worker.
+    """
+    if not configs:
+        configs = ['solver=value'] + ['solver=parallel,workers=%d' % n for n in range(1, options.workers + 1)]
+    workers = [pacman.parseAgentArgs(config).get('workers') for config in configs]
+    for size in options.sizes.split(','):
+        theLayout = generateMaze(int(size), options.numGhosts, options.seed)
+        states = recordStates(theLayout, options.numGhosts, options.moves, options.seed, agentArgs)
+        print '%dx%d maze: %d states, %d cores' % (theLayout.width, theLayout.height, len(states), multiprocessing.cpu_count())
+        perSweep = [seconds / max(sweeps, 1) for sweeps, seconds in compareConfigs(states, configs, agentArgs)]
+        one = None
+        if '1' in workers: one = perSweep[workers.index('1')]
+        print '  %-40s %12s %9s %9s' % ('configuration', 'ms per sweep', 'speedup', 'scaling')
+        for config, n, seconds in zip(configs, workers, perSweep):
+            if one != None and n != None: scaling = '%9.2f' % (one / seconds)
+            else: scaling = '%9s' % '-'
+            print '  %-40s %12.2f %9.2f %s' % (config, 1000 * seconds, perSweep[0] / seconds, scaling)
+
+def compareOnLayoutsAndMazes(options, configs, agentArgs):
+    """
+    compareOnLayouts followed by compareOnMazes.
+    """
+    compareOnLayouts(options, configs, agentArgs)
+    compareOnMazes(options, configs, agentArgs)
+
+def compareSettings(options, configs, agentArgs):
+    """
+    Solves every parameter setting given by -p at once on the states of a
+    game on each layout, then prints how often each setting chooses the
+    same move as each of the others, and the time taken against solving
+    the settings one at a time.
+    """
+    settings = mdpAgents.parseSettings(options.settings)
+    names = [mdpAgents.settingName(setting) for setting in settings]
+    for layoutName in options.layouts.split(','):
+        states = recordStates(loadLayout(layoutName), options.numGhosts, options.moves, options.seed, agentArgs)
+        agent = mdpAgents.MDPAgent(**agentArgs)
+        agent.registerInitialState(states[0])
+        moves = []
+        start = time.time()
+        for state in states:
+            agent.observe(state)
+            moves.append(agent.stackedIteration(settings)[0])
+        stacked = time.time() - start
+
+        separate = 0
+        for k, setting in enumerate(settings):
+            args = dict(agentArgs)
+            if 'discount' in setting: args['discount'] = setting['discount']
+            single = mdpAgents.MDPAgent(**args)
+            for name, value in setting.items():
+                setattr(single, mdpAgents.SETTING_PARAMS[name], value)
+            results = runAgent(single, states)
+            separate += sum([r[3] for r in results])
+            if [r[0] for r in results] != [m[k] for m in moves]:
+                print 'Warning: %s moves differently when solved alone' % names[k]
+
+        print '%s: %d states, %d settings solved together in %.1f ms, one at a time in %.1f ms' % (
+            layoutName, len(states), len(settings), 1000 * stacked, 1000 * separate)
+        print '  %-40s %s' % ('setting', ' '.join(['%5d' % (k + 1) for k in range(len(settings))]))
+        for k in range(len(settings)):
+            agree = [len([1 for m in moves if m[k] == m[j]]) * 100 / len(moves) for j in range(len(settings))]
+            print '  %-40s %s' % ('%d %s' % (k + 1, names[k]), ' '.join(['%4d%%' % a for a in agree]))
+
+def compareSuccessors(options, configs, agentArgs):
+    """
+    Generates the successors of every agent's legal actions in the states of
+    a game on each layout, with successors copying their predecessor and
+    with copy on write, and prints the time and allocations per successor.
+    Allocations are the objects the garbage collector tracks, such as
+    lists, agent states and their dictionaries.
+    """
+    for layoutName in options.layouts.split(','):
+        states = recordStates(loadLayout(layoutName), options.numGhosts, options.moves, options.seed, agentArgs)
+        moves = [(state, agent, action) for state in states
+                 for agent in range(state.getNumAgents()) for action in state.getLegalActions(agent)]
+        print '%s: %d states, %d agents, %d successors' % (layoutName, len(states), states[0].getNumAgents(), len(moves))
+        print '  %-20s %12s %14s' % ('successors', 'us each', 'allocations')
+        for copyOnWrite in [False, True]:
+            pacman.GameState.copyOnWrite = copyOnWrite
+            gc.collect()
+            gc.disable()
+            try:
+                before = len(gc.get_objects())
+                start = time.time()
+                successors = [state.generateSuccessor(agent, action) for state, agent, action in moves]
+                seconds = time.time() - start
+                allocations = len(gc.get_objects()) - before - 1    # Less the list of successors
+            finally:
+                gc.enable()
+            pacman.GameState.getAndResetExplored()
+            del successors
+            print '  %-20s %12.1f %14.1f' % (['copied', 'copy on write'][copyOnWrite],
+                1e6 * seconds / len(moves), allocations / float(len(moves)))
+        pacman.GameState.copyOnWrite = False
+
+# Value iteration against policy iteration and modified policy iteration
+BENCHMARKS['solvers'] = compareOnLayouts
+# Warm started value iteration against prioritized sweeping
+BENCHMARKS['prioritized'] = compareOnLayouts
+# Full value iteration against value iteration within a distance of Pacman
+BENCHMARKS['window'] = compareOnLayouts
+# Jacobi value iteration against in-place Gauss-Seidel sweeps
+BENCHMARKS['sweeps'] = compareOnLayouts
+# Value iteration over every cell against the corridor solver
+BENCHMARKS['corridor'] = compareOnGraphs
+# Scaling of the parallel solver from 1 worker to -w workers
+BENCHMARKS['parallel'] = compareScaling
+# Cold value iteration against starting from coarser copies of the map
+BENCHMARKS['multigrid'] = compareOnLayoutsAndMazes
+# Many parameter settings solved at once
+BENCHMARKS['settings'] = compareSettings
+# Generating successor states by copying against copy on write
+BENCHMARKS['successors'] = compareSuccessors
+
+def readCommand(argv):
+    """
+    Processes the command used to run a benchmark from the command line.
+    """
+    from optparse import OptionParser
+    parser = OptionParser(__doc__)
+    parser.add_option('-l', '--layouts', dest='layouts',
+                      help='comma separated LAYOUTS to benchmark on [Default: %default]',
+                      default='smallGrid,mediumClassic,originalClassic')
+    parser.add_option('-z', '--sizes', dest='sizes',
+                      help='comma separated SIZES of the mazes generated by the parallel and multigrid benchmarks [Default: %default]',
+                      default='101,201')
+    parser.add_option('-w', '--workers', dest='workers', type='int',
+                      help='the largest number of WORKERS the parallel benchmark runs with [Default: one per core]',
+                      default=multiprocessing.cpu_count())
+    parser.add_option('-p', '--settings', dest='settings',
+                      help='parameter SETTINGS for the settings benchmark, as name:value:value/name:value [Default: %default]',
+                      default='discount:0.5:0.7:0.9/ghostReward:-2:-5:-10')
+    parser.add_option('-m', '--moves', dest='moves', type='int',
+                      help='the maximum number of MOVES per layout [Default: %default]', default=100)
+    parser.add_option('-k', '--numghosts', dest='numGhosts', type='int',
+                      help='the number of ghosts [Default: %default]', default=4)
+    parser.add_option('-s', '--seed', dest='seed',
+                      help='random SEED for the recorded game [Default: %default]', default='cs188')
+    parser.add_option('-a', '--agentArgs', dest='agentArgs',
+                      help='agent arguments shared by every configuration [Default: %default]',
+                      default='engine=numpy')
+    parser.add_option('-c', '--configs', dest='configs',
+                      help='semicolon separated agent arguments of the configurations to compare')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 1 or otherjunk[0] not in BENCHMARKS:
+        parser.error('choose one benchmark from ' + ', '.join(sorted(BENCHMARKS)))
+    name = otherjunk[0]
+    if options.configs: configs = options.configs.split(';')
+    else: configs = DEFAULT_CONFIGS[name]
+    return BENCHMARKS[name], options, configs, pacman.parseAgentArgs(options.agentArgs)
+
+if __name__ == '__main__':
+    benchmark, options, configs, agentArgs = readCommand(sys.argv[1:])
+    benchmark(options, configs, agentArgs)
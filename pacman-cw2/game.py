@@ -21,7 +21,7 @@
 # For more info, see http://inst.eecs.berkeley.edu/~cs188/sp09/pacman.html
 
 from util import *
-import time, os
+import time, os, random
 import traceback
 import sys
 
@@ -35,6 +35,15 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+    def setMoveWarningTime(self, seconds): # time a move may take before a warning
+
+    When a game is run with read-only observations, the states an agent is
+    given are read-only views of the game's own state rather than copies
+    (see Game). An agent that changes the states it is given must set
+
+    copyObservations = True
+
+    to be given copies of its own.
     """
     def __init__(self, index=0):
         self.index = index
@@ -190,7 +199,10 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        if isinstance(other, BitGrid): return other == self
+        # The columns of frozen grids are tuples, which never equal lists
+        if type(self.data) == type(other.data): return self.data == other.data
+        return [list(x) for x in self.data] == [list(x) for x in other.data]
 
     def __hash__(self):
         # return hash(str(self))
@@ -205,9 +217,16 @@ class Grid:
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.data = [list(x) for x in self.data]
         return g
 
+    def freeze(self):
+        """
+        Makes the grid read-only, so that setting a cell raises a TypeError.
+        Copies of a frozen grid are not frozen.
+        """
+        self.data = tuple([tuple(x) for x in self.data])
+
     def deepCopy(self):
         return self.copy()
 
@@ -274,6 +293,212 @@ class Grid:
                 bools.append(False)
         return bools
 
+class BitGrid(Grid):
+    """
+    A Grid of booleans packed into the bits of one Python integer, with the
+    same grid[x][y] interface. Cell (x, y) is bit x * height + y, so the
+    integer is the one Grid.__hash__ builds, and the two hash the same.
+
+    The number of True cells is kept as cells are set, so count() is O(1),
+    and the hash is kept until the grid changes. Copies share the integer,
+    which cannot change, so copying a BitGrid does not copy its cells.
+    """
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+        self.width = width
+        self.height = height
+        if initialValue:
+            self.bits = (1 << (width * height)) - 1
+            self.numTrue = width * height
+        else:
+            self.bits = 0
+            self.numTrue = 0
+        self._hash = None
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+
+    def fromGrid(grid):
+        """
+        Returns a BitGrid holding the same cells as a Grid.
+        """
+        bits = 0
+        for x, y in grid.asList():
+            bits |= 1 << (x * grid.height + y)
+        return BitGrid._fromBits(grid.width, grid.height, bits)
+    fromGrid = staticmethod(fromGrid)
+
+    def _fromBits(width, height, bits, numTrue=None):
+        g = BitGrid(width, height)
+        g.bits = bits
+        if numTrue == None: numTrue = bin(bits).count('1')
+        g.numTrue = numTrue
+        return g
+    _fromBits = staticmethod(_fromBits)
+
+    def __getitem__(self, x):
+        # Bounds are checked as for a list, which also ends iteration over the columns
+        if x < 0: x += self.width
+        if x < 0 or x >= self.width: raise IndexError(x)
+        return BitColumn(self, x)
+
+    def __setitem__(self, x, column):
+        for y in range(self.height):
+            self.set(x, y, column[y])
+
+    def get(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def set(self, x, y, value):
+        bit = 1 << (x * self.height + y)
+        if value and not self.bits & bit:
+            self.bits |= bit
+            self.numTrue += 1
+            self._hash = None
+        elif not value and self.bits & bit:
+            self.bits &= ~bit
+            self.numTrue -= 1
+            self._hash = None
+
+    def __str__(self):
+        out = [[str(self.get(x, y))[0] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None: return False
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.height == other.height and self.width == other.width
+        return self.width == other.width and self.height == other.height and self.asList() == other.asList()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._hash == None: self._hash = hash(self.bits)
+        return self._hash
+
+    def copy(self):
+        g = BitGrid._fromBits(self.width, self.height, self.bits, self.numTrue)
+        g._hash = self._hash
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        # Grid's shallow copies share their cells, so that a change to one
+        # shows in the other. Nothing relies on that, and the cells of a
+        # BitGrid cannot be shared that way, so this is a copy
+        return self.copy()
+
+    def count(self, item=True):
+        if item: return self.numTrue
+        return self.width * self.height - self.numTrue
+
+    def asList(self, key=True):
+        bits = self.bits
+        if not key: bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        list = []
+        while bits:
+            # Skips to the next set bit
+            low = bits & -bits
+            cell = low.bit_length() - 1
+            list.append(self._cellIndexToPosition(cell))
+            bits ^= low
+        return list
+
+    def packBits(self):
+        """
+        Returns the same int list representation as Grid.packBits
+        """
+        bits = [self.width, self.height]
+        cells = self.width * self.height
+        for start in range(0, cells + 1, self.CELLS_PER_INT):
+            if start == cells and cells % self.CELLS_PER_INT: break
+            chunk = (self.bits >> start) & ((1 << self.CELLS_PER_INT) - 1)
+            # Grid packs the first cell of each int into its highest bit
+            bits.append(int(('{0:0%db}' % self.CELLS_PER_INT).format(chunk)[::-1], 2))
+        return tuple(bits)
+
+    def _unpackBits(self, bits):
+        cell = 0
+        for packed in bits:
+            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
+                if cell == self.width * self.height: break
+                x, y = self._cellIndexToPosition(cell)
+                self.set(x, y, bit)
+                cell += 1
+
+class BitColumn:
+    """
+    Column x of a BitGrid, so that grid[x][y] reads and sets single cells.
+    """
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __getitem__(self, y):
+        grid = self.grid
+        if y < 0: y += grid.height
+        if y < 0 or y >= grid.height: raise IndexError(y)
+        return (grid.bits >> (self.x * grid.height + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0: y += self.grid.height
+        if y < 0 or y >= self.grid.height: raise IndexError(y)
+        self.grid.set(self.x, y, value)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        column = self.grid.bits >> (self.x * self.grid.height)
+        for y in range(self.grid.height):
+            yield (column >> y) & 1 == 1
+
+    def count(self, item=True):
+        return len([cell for cell in self if cell == item])
+
+class ZobristTable:
+    """
+    Random keys for Zobrist hashing of the states of games on maps of one
+    size. The hash of a state is the exclusive or of the keys of its food
+    cells, its capsule cells and its agents, so when a move changes a few
+    of these the hash is updated by xoring out their old keys and xoring in
+    their new ones, rather than worked out again.
+
+    Keys of food and capsule cells are drawn up front, and those of agents,
+    by (index, position, direction, scared timer), as they are first needed.
+    """
+    def __init__(self, width, height):
+        self.height = height
+        self.random = random.Random(width * 1000 + height)
+        self.food = [self.random.getrandbits(62) for i in range(width * height)]
+        self.capsules = [self.random.getrandbits(62) for i in range(width * height)]
+        self.agents = {}
+
+    def cell(self, position):
+        x, y = position
+        return x * self.height + y
+
+    def agent(self, index, agentState):
+        if agentState.configuration == None: key = (index, None, None, agentState.scaredTimer)
+        else:
+            key = (index, agentState.configuration.pos, agentState.configuration.direction, agentState.scaredTimer)
+        if key not in self.agents: self.agents[key] = self.random.getrandbits(62)
+        return self.agents[key]
+
+def zobristTable(layout):
+    """
+    Returns the ZobristTable for maps of the size of layout.
+    """
+    size = (layout.width, layout.height)
+    if size not in _zobristTables: _zobristTables[size] = ZobristTable(layout.width, layout.height)
+    return _zobristTables[size]
+
+_zobristTables = {}
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -372,14 +597,27 @@ class GameStateData:
     """
 
     """
-    def __init__( self, prevState = None ):
+    def __init__( self, prevState = None, share = False ):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        With share, the agent states and capsule list are not copied but shared
+        with the predecessor, until writableAgentState or writableCapsules is
+        called to change them.
         """
+        self._sharedAgents = set()
+        self._sharedCapsules = False
+        self._zobrist = None    # Zobrist hash of food, capsules and agents, once worked out
         if prevState != None:
             self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            if share:
+                self.capsules = prevState.capsules
+                self.agentStates = prevState.agentStates[:]
+                self._sharedAgents = set(range(len(self.agentStates)))
+                self._sharedCapsules = True
+            else:
+                self.capsules = prevState.capsules[:]
+                self.agentStates = self.copyAgentStates( prevState.agentStates )
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
@@ -400,8 +638,29 @@ class GameStateData:
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
+        state._zobrist = self._zobrist
         return state
 
+    def writableAgentState( self, index ):
+        """
+        Returns the state of agent index, first copying it if it is shared with
+        the predecessor, so that it can be changed.
+        """
+        if index in self._sharedAgents:
+            self.agentStates[index] = self.agentStates[index].copy()
+            self._sharedAgents.remove(index)
+        return self.agentStates[index]
+
+    def writableCapsules( self ):
+        """
+        Returns the capsule list, first copying it if it is shared with the
+        predecessor, so that it can be changed.
+        """
+        if self._sharedCapsules:
+            self.capsules = self.capsules[:]
+            self._sharedCapsules = False
+        return self.capsules
+
     def copyAgentStates( self, agentStates ):
         copiedStates = []
         for agentState in agentStates:
@@ -414,9 +673,12 @@ class GameStateData:
         """
         if other == None: return False
         # TODO Check for type of other
-        if not self.agentStates == other.agentStates: return False
+        # States with different hashes differ, without comparing their food
+        if hash(self) != hash(other): return False
+        # A read-only view (see pacman.GameStateDataView) hands out tuples
+        if not self.agentStates == list(other.agentStates): return False
         if not self.food == other.food: return False
-        if not self.capsules == other.capsules: return False
+        if not self.capsules == list(other.capsules): return False
         if not self.score == other.score: return False
         return True
 
@@ -424,13 +686,37 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        return self.zobrist() ^ hash(self.score)
+
+    def zobrist( self ):
+        """
+        Returns the Zobrist hash of the food, capsules and agents (see
+        ZobristTable), working it out if no predecessor passed it on.
+        """
+        if self._zobrist == None:
+            table = zobristTable(self.layout)
+            h = 0
+            for position in self.food.asList(): h ^= table.food[table.cell(position)]
+            for position in self.capsules: h ^= table.capsules[table.cell(position)]
+            for index, agentState in enumerate(self.agentStates): h ^= table.agent(index, agentState)
+            self._zobrist = h
+        return self._zobrist
+
+    def updateZobrist( self, prevState ):
+        """
+        Works out the Zobrist hash of a successor of prevState from the hash of
+        prevState and what the move changed. Called once the move is made.
+        """
+        if prevState._zobrist == None or self._foodAdded != None: return
+        table = zobristTable(self.layout)
+        h = prevState._zobrist
+        if self._foodEaten != None: h ^= table.food[table.cell(self._foodEaten)]
+        if self._capsuleEaten != None: h ^= table.capsules[table.cell(self._capsuleEaten)]
+        for index, agentState in enumerate(self.agentStates):
+            # Agent states still shared with prevState are unchanged
+            if index not in self._sharedAgents:
+                h ^= table.agent(index, prevState.agentStates[index]) ^ table.agent(index, agentState)
+        self._zobrist = h
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -488,9 +774,9 @@ class GameStateData:
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.food = layout.food.copy()
+        self.food = BitGrid.fromGrid(layout.food)
         #self.capsules = []
-        self.capsules = layout.capsules[:]
+        self.capsules = list(layout.capsules)
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
@@ -513,9 +799,16 @@ except:
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
+
+    With readOnlyObservations, agents are given a read-only view of the state,
+    from its readOnlyView method, in place of a deep copy. States are never
+    changed once made, only replaced by their successors, so a view stays the
+    same after the game moves on. Agents with copyObservations set, and games
+    whose states have no readOnlyView, still get copies.
     """
 
-    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False ):
+    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False,
+                  readOnlyObservations=False ):
         self.agentCrashed = False
         self.agents = agents
         self.display = display
@@ -524,6 +817,7 @@ class Game:
         self.gameOver = False
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
+        self.readOnlyObservations = readOnlyObservations
         self.moveHistory = []
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
@@ -531,6 +825,14 @@ class Game:
         import cStringIO
         self.agentOutput = [cStringIO.StringIO() for agent in agents]
 
+    def observation(self, agentIndex):
+        """
+        Returns what the agent is given of the current state: a copy, or a
+        read-only view of it.
+        """
+        if self.copiers[agentIndex]: return self.state.deepCopy()
+        return self.state.readOnlyView()
+
     def getProgress(self):
         if self.gameOver:
             return 1.0
@@ -570,6 +872,10 @@ class Game:
         """
         self.display.initialize(self.state.data)
         self.numMoves = 0
+        # What each agent is given, decided once rather than on every turn
+        self.observers = ['observationFunction' in dir(agent) for agent in self.agents]
+        self.copiers = [not self.readOnlyObservations or not hasattr(self.state, 'readOnlyView')
+                        or getattr(agent, 'copyObservations', False) for agent in self.agents]
 
         ###self.display.initialize(self.state.makeObservation(1).data)
         # inform learning agents of the game start
@@ -583,6 +889,8 @@ class Game:
                 self.unmute()
                 self._agentCrash(i, quiet=True)
                 return
+            if ("setMoveWarningTime" in dir(agent)):
+                agent.setMoveWarningTime(self.rules.getMoveWarningTime(i))
             if ("registerInitialState" in dir(agent)):
                 self.mute(i)
                 if self.catchExceptions:
@@ -590,7 +898,7 @@ class Game:
                         timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
                         try:
                             start_time = time.time()
-                            timed_func(self.state.deepCopy())
+                            timed_func(self.observation(i))
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
@@ -604,7 +912,7 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    agent.registerInitialState(self.observation(i))
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -617,14 +925,14 @@ class Game:
             move_time = 0
             skip_action = False
             # Generate an observation of the state
-            if 'observationFunction' in dir( agent ):
+            if self.observers[agentIndex]:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
                         timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = timed_func(self.observation(agentIndex))
                         except TimeoutFunctionException:
                             skip_action = True
                         move_time += time.time() - start_time
@@ -634,10 +942,10 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = agent.observationFunction(self.observation(agentIndex))
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self.observation(agentIndex)
 
             # Solicit an action
             action = None
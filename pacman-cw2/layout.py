@@ -22,6 +22,10 @@ VISIBILITY_MATRIX_CACHE = {}
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts cannot be changed once built: the grids are frozen, the lists are
+    tuples and setting an attribute raises an AttributeError. So every game
+    state, and every copy of one, shares the one Layout.
     """
 
     def __init__(self, layoutText):
@@ -36,6 +40,17 @@ class Layout:
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
         # self.initializeVisibilityMatrix()
+        self.layoutText = tuple(self.layoutText)
+        self.capsules = tuple(self.capsules)
+        self.agentPositions = tuple(self.agentPositions)
+        self.walls.freeze()
+        self.food.freeze()
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen'):
+            raise AttributeError("Layouts cannot be changed once built, so cannot set " + name)
+        self.__dict__[name] = value
 
     def getNumGhosts(self):
         return self.numGhosts
@@ -90,7 +105,8 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts cannot be changed, so copies share this one
+        return self
 
     def processLayoutText(self, layoutText):
         """
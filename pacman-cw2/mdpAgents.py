@@ -29,20 +29,282 @@
 # pacmanAgents.py
 
 from pacman import Directions
+from pacman import ClassicGameRules
 from game import Agent
 import api
+import collections
 import random
 import game
+import snapshots
+import solvecache
+import heapq
+import json
+import math
+import multiprocessing
+import sys
+import time
 import util
 
+# numpy is only needed by the array engine, the dict engine runs without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Value iteration engines MDPAgent can be run with, e.g. -a engine=numpy
+ENGINES = ['dict', 'numpy']
+
+# Rules for deciding when value iteration has converged, e.g. -a stop=policy
+#   exact:    stop when a sweep changes no utility at all
+#   residual: stop when no utility changes by more than epsilon
+#   policy:   stop once the error bound on the utilities is too small to change
+#             which move is best from Pacman's cell
+STOP_RULES = ['exact', 'residual', 'policy']
+
+# Solvers the numpy engine can use, e.g. -a engine=numpy,solver=policy
+#   value:    value iteration
+#   policy:   policy iteration, evaluating each policy exactly
+#   modified: modified policy iteration, evaluating each policy with evalSweeps sweeps
+#   prioritized: prioritized sweeping from the utilities of the last move, updating
+#             only cells whose Bellman residual is more than epsilon, largest first
+#   corridor: value iteration over the junctions of the maze only, treating each
+#             corridor as a single move (see api.CorridorGraph), then filling in
+#             the corridor cells. An approximation, as corners are taken like
+#             straight corridor and the sideways slips at junctions are ignored
+#   horizon:  backward induction over the next horizon moves only, with the ghosts
+#             moving as predicted by ghostModel instead of standing still
+#   parallel: red-black value iteration shared out between worker processes, for
+#             very large layouts
+SOLVERS = ['value', 'policy', 'modified', 'prioritized', 'corridor', 'horizon', 'parallel']
+
+# How the horizon solver expects ghosts to move, e.g. -a solver=horizon,ghostModel=directional
+#   random:      any way but back, as ghostAgents.RandomGhost
+#   directional: like ghostAgents.DirectionalGhost, towards pacman (away when
+#                scared) with probability 0.8, taking pacman to stay where it is
+GHOST_MODELS = ['random', 'directional']
+
+# How value iteration sweeps the map, e.g. -a sweep=ordered
+#   jacobi:   every update reads the utilities of the previous sweep
+#   inplace:  Gauss-Seidel, each update reads the latest utilities, so a change
+#             can travel across many cells in one sweep
+#   ordered:  Gauss-Seidel, visiting cells in order of maze distance from the
+#             nearest reward (food, capsule or ghost), so values spread outwards
+#             from them in a single sweep
+SWEEPS = ['jacobi', 'inplace', 'ordered']
+
+# What the situation cache remembers, e.g. -a cache=2048,cacheMode=action
+#   utils:    the converged utilities, so Pacman still picks the best move from
+#             wherever it is in that situation
+#   action:   only the move chosen, which also depends on where Pacman is
+CACHE_MODES = ['utils', 'action']
+
+# Order in which the array engine stores the four moves
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+
+# Parameters the stacked solver can vary, and the MDPAgent attributes they set
+# e.g. -a settings=discount:0.5:0.9/ghostReward:-2:-8 for the four combinations
+SETTING_PARAMS = {'discount': 'discountFactor', 'ghostReward': 'ghostReward', 'foodReward': 'foodReward',
+                  'capsuleReward': 'capsuleReward', 'emptyReward': 'emptyReward'}
+
+# Cell categories of the stacked solver, indexes into its table of rewards
+EMPTY, WALL, CAPSULE, FOOD, RADIUS, GHOST = range(6)
+
+# Reads parameter settings written as name:value:value/name:value..., giving
+# every combination of the values listed
+# Returns: list of dictionaries mapping parameter names to values
+def parseSettings(text):
+    settings = [{}]
+    for part in text.split('/'):
+        fields = part.split(':')
+        if fields[0] not in SETTING_PARAMS:
+            raise Exception("Unknown parameter " + fields[0] + ", expected one of " + str(sorted(SETTING_PARAMS)))
+        settings = [dict(setting, **{fields[0]: float(value)}) for setting in settings for value in fields[1:]]
+    return settings
+
+# Returns: a setting written as it would be given, e.g. discount:0.9/ghostReward:-2
+def settingName(setting):
+    return '/'.join(['%s:%s' % (name, setting[name]) for name in sorted(setting)])
+
+# State of a worker process of the parallel solver, set up by initWorker
+_worker = {}
+
+# Runs in each worker process of the parallel solver as it starts, or in pacman's
+# own process when there is a single worker
+# shared holds the utility, reward and fixed arrays in shared memory, which every
+# process reads and writes. tiles[t][c] holds the array of the free cells of colour
+# c in tile t, and their columns of succ and succProb, taken out once so that each
+# half sweep reads them in order
+def initWorker(shared, tiles, emptyReward, discount):
+    _worker['utils'], _worker['reward'], _worker['fixed'] = [np.frombuffer(a) for a in shared]
+    _worker['tiles'] = tiles
+    _worker['emptyReward'], _worker['discount'] = emptyReward, discount
+
+# Bellman update of the cells of one colour in one tile, in place
+# Cells of one colour only move to cells of the other colour (or stay put), so
+# the tiles of a colour can all be updated at the same time
+# Returns: the largest change made
+def sweepTile(job):
+    tile, colour = job
+    cells, succ, succProb = _worker['tiles'][tile][colour]
+    if len(cells) == 0: return 0.0
+    utils = _worker['utils']
+    expected = succProb[0] * utils[succ[0]]
+    for k in range(1, len(succ)):
+        expected = expected + succProb[k] * utils[succ[k]]
+    new = np.where(_worker['fixed'][cells] > 0, _worker['reward'][cells],
+                   _worker['emptyReward'] + _worker['discount'] * expected.max(axis=0))
+    residual = np.abs(new - utils[cells]).max()
+    utils[cells] = new
+    return residual
+
+# Agent arguments arrive from the command line as strings, e.g. -a warmStart=1
+# Returns: True unless the value reads as false
+def flag(value):
+    return str(value).lower() not in ['0', 'false', 'no', 'off', '']
+
 class MDPAgent(Agent):
 
     # Constructor: this gets run when we first invoke pacman.py
-    def __init__(self):
+    # engine: 'dict' iterates over the coordinate dictionary, 'numpy' runs the
+    # same Bellman updates over flat arrays
+    # warmStart: seed each solve with the utilities converged on the previous move
+    # stop, epsilon: convergence rule (see STOP_RULES) and its tolerance
+    # budget: fraction of the move warning time value iteration may use before the
+    # agent moves with the utilities it has so far (0 for no limit)
+    # solver: how the numpy engine solves the MDP (see SOLVERS)
+    # evalSweeps: sweeps per policy evaluation for the modified solver
+    # directSolve: largest number of free cells for which the policy solver evaluates
+    # a policy by solving its linear equations rather than by sweeping
+    # discount: discount factor
+    # window: only solve cells within this maze distance of pacman, or 'auto' for the
+    # distance past which utilities change pacman's by less than epsilon (0 for the
+    # whole map). Needs engine=numpy and the value solver
+    # windowCheck: also do the full solve, to count how often the window agrees with it
+    # sweep: how value iteration visits the cells (see SWEEPS)
+    # cache: kilobytes of memory for remembering solves of situations seen before
+    # (0 for no cache), cacheMode: what is remembered (see CACHE_MODES)
+    # scaredBucket: number of moves of scared time treated as the same by the cache
+    # solveCache: directory of a cache of converged utilities on disk, shared by
+    # every game and process using it with the same layout and parameters (see
+    # solvecache.py). Needs engine=numpy. solveCacheSize: its limit in megabytes
+    # danger: maze distance from a ghost within which cells share its value, in
+    # place of the square avoidance radius (0 for the square radius)
+    # dangerDecay: fraction of a ghost's value given to cells one step further away
+    # horizon, ghostModel: moves looked ahead by the horizon solver, and how it
+    # expects ghosts to move (see GHOST_MODELS)
+    # ghostSteps: in place of the avoidance radius, give each cell the chance that a
+    # ghost is there in the next ghostSteps moves, as predicted by ghostModel (0 for
+    # the avoidance radius). Cells with less than ghostThreshold chance are left out
+    # stats: record what each solve did, and write it out at the end of each game as
+    # one line of JSON, to statsFile if given and otherwise to the screen, after
+    # printing the sweeps taken per move
+    # snapshots: directory to record each move's utilities and rewards in, one pair
+    # of files per game (see snapshots.py). Moves taken from the action cache are
+    # not recorded
+    # settings: parameter settings (see parseSettings) to also solve for on each move,
+    # all at once, counting how often each would have made the move pacman made.
+    # Needs engine=numpy
+    # workers: processes used by the parallel solver (0 for one per core)
+    # belief: keep a belief over food, capsules and ghosts that cannot be seen (with
+    # api.partialVisibility) and choose moves by QMDP over sampled hypotheses. Needs
+    # engine=numpy, the value solver, and stop=residual or stop=policy
+    # hypotheses: number of fully observed maps the QMDP average is taken over
+    # foodPrior: chance that a cell never seen has food in it
+    # multigrid: number of coarser copies of the map, each merging 2x2 blocks of
+    # cells of the one before, that a cold solve is first worked out on. The
+    # coarsest is solved first and each result starts the solve of the next finer
+    # copy, and finally of the map itself (0 for none). Needs engine=numpy
+    def __init__(self, engine='dict', warmStart=False, stop='exact', epsilon=0.001, budget=0,
+                 solver='value', evalSweeps=5, directSolve=400, discount=0.5,
+                 window=0, windowCheck=False, sweep='jacobi',
+                 cache=0, cacheMode='utils', scaredBucket=1, danger=0, dangerDecay=0.5,
+                 horizon=10, ghostModel='random', workers=0,
+                 belief=False, hypotheses=4, foodPrior=0.5, ghostSteps=0, ghostThreshold=0.05,
+                 stats=False, statsFile='', snapshots='', settings='', multigrid=0,
+                 solveCache='', solveCacheSize=64):
+        if engine not in ENGINES:
+            raise Exception("Unknown engine " + str(engine) + ", expected one of " + str(ENGINES))
+        if engine == 'numpy' and np == None:
+            raise Exception("The numpy engine requires numpy to be installed")
+        if stop not in STOP_RULES:
+            raise Exception("Unknown stop rule " + str(stop) + ", expected one of " + str(STOP_RULES))
+        if solver not in SOLVERS:
+            raise Exception("Unknown solver " + str(solver) + ", expected one of " + str(SOLVERS))
+        if solver != 'value' and engine != 'numpy':
+            raise Exception("The " + solver + " solver needs engine=numpy")
+        if window not in [0, '0'] and (engine != 'numpy' or solver != 'value'):
+            raise Exception("window needs engine=numpy and solver=value")
+        if sweep not in SWEEPS:
+            raise Exception("Unknown sweep " + str(sweep) + ", expected one of " + str(SWEEPS))
+        if sweep != 'jacobi' and (solver != 'value' or window not in [0, '0']):
+            raise Exception("sweep=" + sweep + " needs solver=value and no window")
+        if flag(belief) and (engine != 'numpy' or solver != 'value' or window not in [0, '0'] or float(cache) > 0 or solveCache):
+            raise Exception("belief needs engine=numpy, solver=value, and no window or cache")
+        if flag(belief) and stop == 'exact':
+            # Averaged hypotheses can settle into a cycle in the last bit, so
+            # the residual may never reach exactly 0
+            raise Exception("belief needs stop=residual or stop=policy")
+        if ghostModel not in GHOST_MODELS:
+            raise Exception("Unknown ghost model " + str(ghostModel) + ", expected one of " + str(GHOST_MODELS))
+        if cacheMode not in CACHE_MODES:
+            raise Exception("Unknown cache mode " + str(cacheMode) + ", expected one of " + str(CACHE_MODES))
+        if solveCache and engine != 'numpy':
+            raise Exception("solveCache needs engine=numpy")
+        if int(multigrid) > 0 and (engine != 'numpy' or solver == 'horizon'):
+            raise Exception("multigrid needs engine=numpy and a solver other than horizon")
+        self.engine = engine
+        self.solver = solver
+        self.sweep = sweep
+        self.evalSweeps = int(evalSweeps)
+        self.directSolve = int(directSolve)
+        # Prioritized sweeping only updates the cells that changed since the last move
+        self.warmStart = flag(warmStart) or solver == 'prioritized'
+        self.stop = stop
+        self.epsilon = float(epsilon)
+        self.budget = float(budget)
+        if window == 'auto': self.window = window
+        else: self.window = int(window)
+        self.windowCheck = flag(windowCheck)
+        self.cacheLimit = 1024 * float(cache)
+        self.cacheMode = cacheMode
+        self.scaredBucket = int(scaredBucket)
+        self.danger = int(danger)
+        self.horizon = int(horizon)
+        self.ghostModel = ghostModel
+        self.ghostSteps = int(ghostSteps)
+        self.ghostThreshold = float(ghostThreshold)
+        self.stats = flag(stats)
+        self.statsFile = statsFile
+        self.snapshots = snapshots
+        if snapshots and np == None:
+            raise Exception("Recording snapshots requires numpy to be installed")
+        self.snapshotWriter = None  # Writes this game's snapshots
+        if settings and engine != 'numpy':
+            raise Exception("settings needs engine=numpy")
+        if settings: self.settings = parseSettings(settings)
+        else: self.settings = []
+        self.settingAgreed = [0] * len(self.settings)   # Moves this game each setting agreed with
+        self.moveStats = []         # With stats, a record of each move this game
+        self.residuals = []         # With stats, the residual of each sweep of this move
+        if (solver == 'horizon' or self.ghostSteps > 0) and np == None:
+            raise Exception("Predicting ghosts requires numpy to be installed")
+        self.workers = int(workers) or multiprocessing.cpu_count()
+        self.pool = None            # Worker processes of the parallel solver
+        self.belief = flag(belief)
+        self.hypotheses = int(hypotheses)
+        self.foodPrior = float(foodPrior)
+        self.poolTable = None       # Transition table of the layout they were started for
+        self.dangerDecay = float(dangerDecay)
+        self.multigrid = int(multigrid)
+        self.levels = []            # Coarser copies of the map, finest first
+        # Seconds a move may take, replaced by the game through setMoveWarningTime
+        self.moveWarningTime = ClassicGameRules().getMoveWarningTime(0)
+        self.deadline = None        # Time by which the current solve must finish
+        self.timedOut = False       # Whether the current solve ran out of time
         # params
         self.direcProb = 0.8        # Direction probability (80%)
         self.emptyReward = -0.04    # The 'reward' for moving pacman
-        self.discountFactor = 0.5   # Discount factor
+        self.discountFactor = float(discount)   # Discount factor
         self.avoidRadius = 0        # Radius around a ghost that pacman should avoid
         # Rewards
         self.foodReward = 1         # Reward for food
@@ -57,6 +319,32 @@ class MDPAgent(Agent):
         self.capsules = []          # List of capsules
         self.ghosts = []            # List of ghosts
         self.radiusList = []        # List of coordinates within the avoidance radius
+        self.radiusFactor = {}      # Fraction of the ghost value given to each of them
+        self.dangerBalls = {}       # Cell number -> {cell: maze distance} within danger
+        # Warm start: rewards and utilities converged on the previous move
+        self.lastRewards = None     # Rewards (dict engine) or (reward, fixed) arrays (numpy engine)
+        self.lastUtils = None       # Converged utilities, same layout as lastRewards
+        # Counters
+        self.sweeps = 0             # Sweeps taken by the last solve
+        self.dirty = 0              # Cells whose reward changed since the last solve
+        self.dirtyMask = None       # Those cells, as a boolean array (numpy engine)
+        self.updates = 0            # Bellman updates of single cells made by the last solve
+        self.coarseSweeps = 0       # Sweeps of the last solve made on coarser copies of the map
+        self.coarseUpdates = 0      # and the updates they made
+        self.sweepHistory = []      # Sweeps taken on each move of this game
+        self.timeouts = 0           # Moves this game on which the budget ran out
+        self.windowAgreed = 0       # Moves this game on which the window chose the same
+        self.windowChecked = 0      # move as the full solve, out of this many
+        # Situation cache: fingerprint -> utilities or move, least recently used first
+        self.cache = collections.OrderedDict()
+        self.cacheBytes = 0         # Estimated memory held by the cache
+        self.cacheTable = None      # Transition table of the layout the cache is for
+        self.cacheHits = 0          # Moves this game answered from the cache
+        self.cacheMisses = 0        # Moves this game that had to be solved
+        self.solveCacheDir = solveCache
+        self.solveCacheLimit = 1024 * 1024 * float(solveCacheSize)
+        self.solveCache = None      # The solvecache.SolveCache, opened with the first game
+        self.solvePrefix = None     # Key of the layout and parameters the solves depend on
 
     # Gets run after an MDPAgent object is created and once there is
     # game state to access.
@@ -64,12 +352,50 @@ class MDPAgent(Agent):
         # Lists that stay constant throughout program initialized once
         self.walls = api.walls(state)
         self.whole = self.wholeMap()
+        self.table = api.transitionTable(state, self.direcProb)
+        # Free cells next to each cell, by number, for maze distances
+        self.neighbours = [sorted(set(j for direc in ACTIONS for j in self.table.indices[direc][i]) - set([i]))
+                           for i in range(len(self.whole))]
+        if self.engine == 'numpy': self.buildArrays()
+        if self.multigrid > 0: self.buildLevels()
+        if self.solver == 'corridor': self.buildGraph(state)
+        if self.solver == 'parallel' and self.table is not self.poolTable: self.startWorkers()
+        if self.belief: self.startBelief()
+        if self.solver == 'horizon' or self.ghostSteps > 0: self.ghostTable = api.ghostTransitionTable(state)
+        # Nothing to warm start from in a new game
+        self.lastRewards = None
+        self.lastUtils = None
+        self.sweepHistory = []
+        self.timeouts = 0
+        self.windowAgreed = 0
+        self.windowChecked = 0
+        # Situations carry over between games, but only on the same layout
+        if self.table is not self.cacheTable:
+            self.cache.clear()
+            self.cacheBytes = 0
+            self.cacheTable = self.table
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.moveStats = []
+        self.settingAgreed = [0] * len(self.settings)
+        self.dangerBalls = {}
+        if self.snapshots:
+            if self.snapshotWriter != None: self.snapshotWriter.close()
+            free = [i for i, coord in enumerate(self.whole) if coord in self.table.successors]
+            self.snapshotWriter = snapshots.SnapshotWriter(self.snapshots, self.table.width, self.table.height, free)
         # Avoidance radius of ghosts depends on size of map. Smaller map = smaller radius
         self.avoidRadius = 1#int((min(self.walls[-1]) - 2) / 4)
+        if self.solveCacheDir:
+            if self.solveCache == None:
+                self.solveCache = solvecache.SolveCache(self.solveCacheDir, self.solveCacheLimit)
+            self.solveCache.hits = self.solveCache.misses = 0
+            self.solvePrefix = self.solveKey(state)
+
+    # Gets run by the game before registerInitialState
+    def setMoveWarningTime(self, seconds):
+        self.moveWarningTime = seconds
 
     # Gets pacman to make a move
-    # First, Updates values of states at every call (food, capsules, ghosts etc.)
-    # Then calls value iteration after mapping initial values
     # Returns: A direction to move in (with 80% success) 
     def getAction(self, state):
         # Get the actions we can try, and remove "STOP" if that is one of them.
@@ -77,26 +403,207 @@ class MDPAgent(Agent):
         if Directions.STOP in legal:
             legal.remove(Directions.STOP)
 
-        # Updates new list of entities with new game state
-        self.food = api.food(state)         
+        # Makes a move in the best direction found by chooseMove
+        return api.makeMove(self.chooseMove(state), legal)
+
+    # First, Updates values of states at every call (food, capsules, ghosts etc.)
+    # Then calls value iteration after mapping initial values
+    # Returns: The best direction to move in from pacman's position
+    def chooseMove(self, state):
+        if self.stats:
+            started = time.time()
+            self.residuals = []
+            warm = self.lastUtils is not None
+        self.observe(state)
+        pac = self.pacman
+        if self.budget > 0: self.deadline = time.time() + self.budget * self.moveWarningTime
+        self.timedOut = False
+
+        # A situation seen before needs no solve
+        cached = None
+        if self.cacheLimit > 0 or self.solveCache != None:
+            key = self.fingerprint()
+        if self.cacheLimit > 0:
+            cached = self.cacheGet(key)
+            if cached is not None and self.cacheMode == 'action':
+                self.sweeps = 0
+                self.sweepHistory.append(0)
+                if self.stats: self.recordMove(started, False, True)
+                return cached
+        # or it may have been solved by an earlier game, or another process
+        fromDisk = False
+        if cached is None and self.solveCache != None:
+            cached = self.solveCache.get((self.solvePrefix, key))
+            fromDisk = cached is not None
+
+        if self.engine == 'numpy':
+            # Same updates as below, carried out on flat arrays
+            if self.belief: self.updateBelief(state)
+            reward, fixed = self.mapArrays()
+            start = self.warmArray(reward, fixed)
+            if self.belief and cached is None:
+                utils = self.qmdp(reward, fixed)
+            elif cached is not None:
+                self.sweeps, self.updates = 0, 0
+                utils = cached
+                if self.warmStart: self.lastUtils = utils
+            else:
+                utils = self.solveArray(reward, fixed, start)
+            dictMap = dict(zip(self.whole, utils.tolist()))
+            if self.window and self.windowCheck and cached is None:
+                self.checkWindow(reward, fixed, start, dictMap)
+        else:
+            # Updates map with new info e.g. eaten food / capsules / ghosts
+            dictMap = self.mapValues(state, self.whole)
+            rewards = dictMap.copy()
+            if cached is not None:
+                self.sweeps = 0
+                dictMap = cached.copy()
+            else:
+                self.warmMap(dictMap)
+                # Converges the mapped values from mapValues using Bellman update
+                self.valueIteration(dictMap)
+            if self.warmStart:
+                self.lastRewards, self.lastUtils = rewards, dictMap.copy()
+        self.sweepHistory.append(self.sweeps)
+        if self.timedOut: self.timeouts += 1
+
+        # ---- PRINTS FOR DEBUG ----
+        #self.gridPrint(state, dictMap)      # Print grid in terminal
+        #print sorted(dictMap.iteritems())  # Print dictionary of full util values
+
+        # findMax returns the best direction to move
+        move = self.findMax(pac, dictMap)[0]
+        # Utilities cut short by the time budget are not worth keeping
+        if self.cacheLimit > 0 and (cached is None or fromDisk) and not self.timedOut:
+            if self.cacheMode == 'action': self.cachePut(key, move)
+            elif self.engine == 'numpy': self.cachePut(key, np.array(utils))
+            else: self.cachePut(key, dictMap.copy())
+        if self.solveCache != None and cached is None and not self.timedOut:
+            self.solveCache.put((self.solvePrefix, key), utils)
+        if self.stats: self.recordMove(started, warm and cached is None, cached is not None)
+        if self.settings:
+            sweeps, updates = self.sweeps, self.updates
+            for k, other in enumerate(self.stackedIteration(self.settings)[0]):
+                if other == move: self.settingAgreed[k] += 1
+            self.sweeps, self.updates = sweeps, updates
+        if self.snapshotWriter != None:
+            if self.engine == 'dict': utils, reward = [dictMap[c] for c in self.whole], [rewards[c] for c in self.whole]
+            self.snapshotWriter.write(move, self.table.index(pac), self.sweeps, utils, reward)
+        return move
+
+    # Updates new list of entities with new game state
+    def observe(self, state):
+        self.food = api.food(state)
         self.capsules = api.capsules(state)
         self.ghosts = api.ghosts(state)
         self.stateTimes = api.ghostStatesWithTimes(state)
+        self.ghostCount = api.ghostCount(state)
+        if self.solver == 'horizon' or self.ghostSteps > 0: self.ghostHeadings = api.ghostDirections(state)
+        self.pacman = api.whereAmI(state)
         self.ghostRadius()
-        pac = api.whereAmI(state)
 
-        # Updates map with new info e.g. eaten food / capsules / ghosts
-        dictMap = self.mapValues(state, self.whole)
-        # Converges the mapped values from mapValues using Bellman update
-        self.valueIteration(dictMap)
+    # Adds this move's record to moveStats: sweeps, residual of each sweep, time
+    # taken in milliseconds, cells updated (by the numpy engine), and whether it
+    # was warm started or answered from the cache
+    def recordMove(self, started, warm, cached):
+        self.moveStats.append({'sweeps': self.sweeps,
+                               'residuals': [float('%.3g' % r) for r in self.residuals],
+                               'ms': round(1000 * (time.time() - started), 2),
+                               'updates': self.updates if self.engine == 'numpy' else None,
+                               'warm': warm, 'cached': cached, 'timedOut': self.timedOut})
 
-        # ---- PRINTS FOR DEBUG ----
-        #self.gridPrint(state, dictMap)      # Print grid in terminal
-        #print sorted(dictMap.iteritems())  # Print dictionary of full util values
+    # A compact description of everything the solve depends on: the food left
+    # as a bitmask over cell numbers, the capsules left, and where each ghost is
+    # with its scared time in steps of scaredBucket moves. Pacman's cell is added
+    # when the result depends on it: when caching moves, when stopping by the
+    # policy rule, when solving a window around Pacman, and when ghosts are expected
+    # to chase Pacman
+    # Returns: a hashable fingerprint of the current situation
+    def fingerprint(self):
+        food = 0
+        for f in self.food: food |= 1 << self.table.index(f)
+        ghosts = tuple(sorted((pos, timer // self.scaredBucket) for pos, timer in self.stateTimes))
+        key = (food, tuple(sorted(self.capsules)), ghosts)
+        if self.cacheMode == 'action' or self.stop == 'policy' or self.window or self.ghostModel == 'directional':
+            key += (self.pacman,)
+        # The horizon solver also depends on which way the ghosts are heading
+        if self.solver == 'horizon' or self.ghostSteps > 0: key += (tuple(self.ghostHeadings),)
+        return key
+
+    # Key of everything besides the situation that the utilities of a solve depend
+    # on: the layout, the motion model and the agent's parameters. Used with
+    # fingerprint as the key of the solve cache
+    def solveKey(self, state):
+        params = (self.solver, self.sweep, self.stop, self.epsilon, self.evalSweeps, self.directSolve,
+                  self.discountFactor, self.direcProb, api.nonDeterministic, self.emptyReward,
+                  self.foodReward, self.capsuleReward, self.ghostReward, self.avoidRadius,
+                  self.scaredBucket, self.danger, self.dangerDecay, self.horizon, self.ghostModel,
+                  self.ghostSteps, self.ghostThreshold, str(self.window), self.multigrid)
+        return (str(state.getWalls()), params)
+
+    # Looks a situation up in the cache, marking it as the most recently used
+    # Returns: the cached utilities or move, or None if the situation is not cached
+    def cacheGet(self, key):
+        if key not in self.cache:
+            self.cacheMisses += 1
+            return None
+        self.cacheHits += 1
+        value = self.cache.pop(key)
+        self.cache[key] = value
+        return value[0]
 
-        # Makes a move by calling findMax function that returns the best direction to move
-        return api.makeMove(self.findMax(pac, dictMap)[0], legal)
+    # Adds a situation to the cache, then drops the least recently used ones
+    # until the cache fits in cacheLimit bytes
+    def cachePut(self, key, value):
+        size = sys.getsizeof(key) + sys.getsizeof(key[0])
+        if np != None and isinstance(value, np.ndarray): size += value.nbytes
+        elif isinstance(value, dict): size += sys.getsizeof(value) + len(value) * sys.getsizeof(0.0)
+        else: size += sys.getsizeof(value)
+        self.cache[key] = (value, size)
+        self.cacheBytes += size
+        while self.cacheBytes > self.cacheLimit and self.cache:
+            oldKey, (oldValue, oldSize) = self.cache.popitem(last=False)
+            self.cacheBytes -= oldSize
 
+    # Gets run at the end of every game
+    # With stats, reports how many sweeps value iteration needed per move
+    def final(self, state):
+        self.stopWorkers()
+        moves = len(self.sweepHistory)
+        if moves == 0: return
+        if self.stats:
+            print "Value iteration: %d sweeps over %d moves (%.1f per move)" % (sum(self.sweepHistory), moves, sum(self.sweepHistory) / float(moves))
+        if self.timeouts > 0:
+            print "Value iteration: ran out of time on %d moves" % self.timeouts
+        if self.windowChecked > 0:
+            print "Value iteration: window agreed with the full solve on %d of %d moves" % (self.windowAgreed, self.windowChecked)
+        if self.cacheLimit > 0:
+            print "Situation cache: %d hits, %d misses, %d entries (%.0f KB)" % (self.cacheHits, self.cacheMisses, len(self.cache), self.cacheBytes / 1024.0)
+        if self.solveCache != None:
+            print "Solve cache: %d hits, %d misses (%.0f KB on disk)" % (self.solveCache.hits, self.solveCache.misses, self.solveCache.bytes / 1024.0)
+        if self.stats: self.writeStats(state)
+        for setting, agreed in zip(self.settings, self.settingAgreed):
+            print "Setting %s: same move on %d of %d moves" % (settingName(setting), agreed, moves)
+        if self.snapshotWriter != None:
+            self.snapshotWriter.close()
+            self.snapshotWriter = None
+
+    # Writes the game's move records as one line of JSON, with totals first
+    def writeStats(self, state):
+        ms = [m['ms'] for m in self.moveStats]
+        record = {'score': state.getScore(), 'win': state.isWin(), 'moves': len(self.moveStats),
+                  'sweeps': sum(self.sweepHistory), 'ms': round(sum(ms), 2), 'maxMs': max(ms or [0]),
+                  'updates': sum([m['updates'] or 0 for m in self.moveStats]),
+                  'warm': len([m for m in self.moveStats if m['warm']]),
+                  'cached': len([m for m in self.moveStats if m['cached']]),
+                  'timedOut': self.timeouts, 'perMove': self.moveStats}
+        line = json.dumps(record, sort_keys=True, separators=(',', ':'))
+        if self.statsFile:
+            f = open(self.statsFile, 'a')
+            try: f.write(line + '\n')
+            finally: f.close()
+        else: print line
     # Returns a list of tuples representing coordinates of the whole map 
     # Called once at initialization
     def wholeMap(self):
@@ -108,30 +615,67 @@ class MDPAgent(Agent):
 
     # Creates a list of all new locations within the avoidRadius of all ghosts
     # i.e. a square ring area with side lengths avoidRadius + 1 not including ghost coords
+    # With danger or ghostSteps set, uses dangerField or ghostField instead
     def ghostRadius(self):
         self.radiusList = []        # reset list of new radius
+        self.radiusFactor = {}
+        if self.ghostSteps > 0: return self.ghostField()
+        if self.danger > 0: return self.dangerField()
         for ghost in self.ghosts:
             for i in range(int(ghost[0]-self.avoidRadius), int(ghost[0]+self.avoidRadius+1)):
                 for j in range(int(ghost[1]-self.avoidRadius), int(ghost[1]+self.avoidRadius+1)):
                     # If rounded radius coord around ghost (because scared ghosts move in half steps)
                     # is not diagonal to ghosts and is not a wall or the ghost itself, add to radiusList
                     if (int(i), int(j)) not in self.walls or not ghost: self.radiusList.append((int(i), int(j)))
+        for coord in self.radiusList: self.radiusFactor[coord] = 0.5
+
+    # Lists the free cells within danger moves of a ghost, found by a breadth first
+    # search from every ghost, so danger does not pass through walls. A cell d moves
+    # from the nearest ghost gets dangerDecay ** d of the ghost value
+    # The search from each cell is kept for the rest of the game, so as ghosts move
+    # only the cells they move into are searched from
+    def dangerField(self):
+        nearest = {}
+        for ghost in self.ghosts:
+            cell = self.table.index((int(ghost[0]), int(ghost[1])))
+            if cell not in self.dangerBalls: self.dangerBalls[cell] = self.mazeBall(cell, self.danger)
+            for i, distance in self.dangerBalls[cell].iteritems():
+                if 0 < distance < nearest.get(i, self.danger + 1): nearest[i] = distance
+        for i in sorted(nearest):
+            self.radiusList.append(self.whole[i])
+            self.radiusFactor[self.whole[i]] = self.dangerDecay ** nearest[i]
 
     # Updates the utility values of all the ghosts depending on their states
     # Returns: utility value of a specified ghost at a coordinate
     def ghostValue(self, coord):
         for pair in self.stateTimes:
-            if pair[1] == 0: util = self.ghostReward    # i.e. not scared = default value
-            else: util = (pair[1] - 20) / 2.5           # function mapping scared time left to ranges 8 to -8
+            util = self.scaredValue(pair[1])
         return util
 
+    # Returns: utility value of a ghost with the given scared time left
+    def scaredValue(self, timer):
+        if timer == 0: return self.ghostReward          # i.e. not scared = default value
+        return (timer - 20) / 2.5                       # function mapping scared time left to ranges 8 to -8
+
+    # Lists the cells a ghost may reach in the next ghostSteps moves, with the chance
+    # that some ghost is in each of them at one of those moves as its fraction of
+    # the ghost value
+    def ghostField(self):
+        free = np.ones(self.ghostTable.width * self.ghostTable.height)
+        for steps in self.predictGhosts(self.ghostSteps):
+            free *= 1 - np.max(steps[1:], axis=0)
+        danger = 1 - free
+        for i in np.flatnonzero(danger >= self.ghostThreshold):
+            self.radiusList.append(self.whole[i])
+            self.radiusFactor[self.whole[i]] = danger[i]
+
     # Creates a dictionary of coordinate - utility value pairs
     # Returns: A dictionary mapping coordinate values to utility values
     def mapValues(self, state, map1):
         dictMap = {}
         for i in map1:
             if i in self.ghosts: dictMap[i] = self.ghostValue(i)            # Util of ghost calculated using ghostValue
-            elif i in self.radiusList: dictMap[i] = self.ghostValue(i) / 2  # Util of cells near ghosts = half of ghostValue
+            elif i in self.radiusList: dictMap[i] = self.ghostValue(i) * self.radiusFactor[i]  # Util of cells near ghosts = fraction of ghostValue
             elif i in self.food: dictMap[i] = self.foodReward               # Util of food = foodReward
             elif i in self.capsules: dictMap[i] = self.capsuleReward        # Util of capsules = capsuleReward
             elif i in self.walls: dictMap[i] = 0                            # Util of walls = 0
@@ -150,48 +694,908 @@ class MDPAgent(Agent):
         return max(self.utilityDict.iteritems(), key = lambda x: x[1])
     
     # Called 4 times in findMax, 1 for each direction
-    # Sums up the utility of each of the 4 directions by calculating
-    # front, left and right probabilities
+    # Sums up the utility of each cell pacman may end up in when moving in direc
+    # (front, left and right, or staying in place when hitting a wall), weighted
+    # by its probability in the transition table
     def setUtil(self, direc, coord, dictMap):
-        # Dictionary mapping direction parameter to actual coordinate locations around it
-        dirDict = {
-            Directions.NORTH: (coord[0], coord[1] + 1), 
-            Directions.SOUTH: (coord[0], coord[1] - 1), 
-            Directions.EAST: (coord[0] + 1, coord[1]), 
-            Directions.WEST: (coord[0] - 1, coord[1]), 
-        }
-
-        # If direction (direc) not a wall,
-        # multiply direction probability with utility
-        # otherwise stay in place (coord)
-        if dirDict[direc] not in self.walls:
-            util = (self.direcProb * dictMap[dirDict[direc]])
-        else:
-            util = (self.direcProb * dictMap[coord])
-        # LEFT perpendicular
-        if dirDict[Directions.LEFT[direc]] not in self.walls:
-            util += (((1 - self.direcProb)/2) * dictMap[dirDict[Directions.LEFT[direc]]])
-        else: # stay in place
-            util += (((1 - self.direcProb)/2) * dictMap[coord])
-        # RIGHT perpendicular
-        if dirDict[Directions.RIGHT[direc]] not in self.walls:
-            util += (((1 - self.direcProb)/2) * dictMap[dirDict[Directions.RIGHT[direc]]])
-        else: # stay in place
-            util += (((1 - self.direcProb)/2) * dictMap[coord])
-
+        util = 0.0
+        for nextCoord, prob in self.table.successors[coord][direc]:
+            util += prob * dictMap[nextCoord]
         return util
 
     # Converges util values performing Bellman update
     # Returns: new dictionary mapping with converged values from Bellman update
     def valueIteration(self, dictMap):
-        oldMap = None
-        while dictMap != oldMap:
+        self.sweeps = 0
+        fixed = set(self.walls + self.food + self.ghosts + self.radiusList + self.capsules)
+        if self.sweep != 'jacobi': return self.gaussSeidel(dictMap, fixed)
+        while True:
+            self.sweeps += 1
             oldMap = dictMap.copy()
             for i in self.whole:    # Iterate through created map
-                if i not in self.walls + self.food + self.ghosts + self.radiusList + self.capsules:
+                if i not in fixed:
                     # Bellman update
                     dictMap[i] = self.emptyReward + (self.discountFactor * self.findMax(i, oldMap)[1])
-        return dictMap
+            residual = max([abs(dictMap[i] - oldMap[i]) for i in self.whole])
+            if self.converged(residual, dictMap):
+                return dictMap
+
+    # Gauss-Seidel version of valueIteration: updates dictMap in place, so each
+    # Bellman update reads the utilities already updated this sweep, and no copy
+    # of the map is made
+    # Returns: dictMap, with converged utilities
+    def gaussSeidel(self, dictMap, fixed):
+        free = [i for i in self.whole if i not in fixed]
+        if self.sweep == 'ordered':
+            sources = [self.table.index(i) for i in fixed if i not in self.walls]
+            free = [self.whole[i] for i in self.sweepOrder(sources, [self.table.index(i) for i in free])]
+        while True:
+            self.sweeps += 1
+            residual = 0
+            for i in free:
+                util = self.emptyReward + (self.discountFactor * self.findMax(i, dictMap)[1])
+                residual = max(residual, abs(util - dictMap[i]))
+                dictMap[i] = util
+            if self.converged(residual, dictMap):
+                return dictMap
+
+    # Orders cells by maze distance from the nearest of the source cells, found
+    # by a breadth first search out from all of them at once. Cells the search
+    # does not reach go last, in their original order
+    # Returns: list of the cells, nearest first
+    def sweepOrder(self, sources, cells):
+        distance = dict((i, 0) for i in sources)
+        frontier = list(distance)
+        while frontier:
+            nextFrontier = []
+            for i in frontier:
+                for j in self.neighbours[i]:
+                    if j not in distance:
+                        distance[j] = distance[i] + 1
+                        nextFrontier.append(j)
+            frontier = nextFrontier
+        unreached = len(self.whole)
+        return sorted(cells, key=lambda i: distance.get(i, unreached))
+
+    # Decides whether to stop sweeping, given the largest change made by the last
+    # sweep and the utilities it produced
+    # With discount g, the utilities are within g * residual / (1 - g) of the true
+    # ones, so expected utilities of Pacman's moves are too. If the best move is
+    # ahead of the others by more than twice that, more sweeps cannot change it
+    # model is the one the utilities were worked out with, see expectedArray
+    # Returns: True if value iteration should stop
+    def converged(self, residual, utils, model=None):
+        if self.stats: self.residuals.append(residual)
+        if self.outOfTime():
+            return True
+        if self.stop == 'exact':
+            return residual == 0
+        if self.stop == 'residual':
+            return residual <= self.epsilon
+        values = sorted(self.moveValues(self.pacman, utils, model), reverse=True)
+        bound = self.discountFactor * residual / (1 - self.discountFactor)
+        return residual == 0 or values[0] - values[1] > 2 * bound
+
+    # Returns: True if the current solve has used up its budget
+    def outOfTime(self):
+        if self.deadline != None and time.time() > self.deadline:
+            self.timedOut = True
+        return self.timedOut
+
+    # Returns: expected utility of each move in ACTIONS from coord, for either engine
+    def moveValues(self, coord, utils, model=None):
+        if self.engine == 'dict':
+            return [self.setUtil(direc, coord, utils) for direc in ACTIONS]
+        index = (model or self.model)[2]
+        return self.expectedArray(utils, index[coord], model).tolist()
+
+    # Builds the arrays used by the numpy engine from the transition table
+    # Cell i of every array is the coordinate self.whole[i], which is also cell i of
+    # the table. self.succ[k, a, i] is the k-th cell pacman may end up in when making
+    # move ACTIONS[a] from cell i, and self.succProb[k, a, i] its probability
+    # Walls have no successors, so their entries point at themselves with probability 0
+    # Called once at initialization
+    def buildArrays(self):
+        self.index = dict((coord, i) for i, coord in enumerate(self.whole))
+        self.wallMask = np.zeros(len(self.whole), dtype=bool)
+        for wall in self.walls:
+            self.wallMask[self.index[wall]] = True
+
+        table = self.table
+        outcomes = max([len(p) for p in table.probs[ACTIONS[0]]])
+        self.succ = np.tile(np.arange(len(self.whole)), (outcomes, len(ACTIONS), 1))
+        self.succProb = np.zeros(self.succ.shape)
+        for a, direc in enumerate(ACTIONS):
+            for i in range(len(self.whole)):
+                for k in range(len(table.indices[direc][i])):
+                    self.succ[k, a, i] = table.indices[direc][i][k]
+                    self.succProb[k, a, i] = table.probs[direc][i][k]
+        # The arrays solvers use unless given others, see expectedArray
+        self.model = (self.succ, self.succProb, self.index)
+
+        # For the solvers that update one cell at a time, the (successors,
+        # probabilities) of each move from each free cell
+        if self.solver == 'prioritized' or self.sweep != 'jacobi':
+            self.backups = [[(table.indices[direc][i], table.probs[direc][i]) for direc in ACTIONS]
+                            for i in range(len(self.whole))]
+        # and for prioritized sweeping, the cells whose utility depends on each cell
+        if self.solver == 'prioritized':
+            predecessors = [set() for i in self.whole]
+            for i in range(len(self.whole)):
+                for succ, prob in self.backups[i]:
+                    for j in succ: predecessors[j].add(i)
+            self.predecessors = [list(p) for p in predecessors]
+
+    # Expected utility of each move, summed in the same order as setUtil
+    # cells selects the cells to work out, all of them by default
+    # model is a (succ, succProb, index) triple for solving part of the map, where
+    # index maps coordinates to cells. It defaults to the whole map, self.model
+    # Returns: array of shape (4,) + shape of cells
+    def expectedArray(self, utils, cells=Ellipsis, model=None):
+        succ, succProb = (model or self.model)[:2]
+        expected = succProb[0][:, cells] * utils[succ[0][:, cells]]
+        for k in range(1, len(succ)):
+            expected = expected + succProb[k][:, cells] * utils[succ[k][:, cells]]
+        return expected
+
+    # Array version of mapValues. Later assignments overwrite earlier ones, so the
+    # order below gives the same priorities as mapValues (ghosts first, walls last)
+    # Returns: array of rewards and boolean array of cells whose value is fixed
+    def mapArrays(self):
+        reward = np.full(len(self.whole), float(self.emptyReward))
+        fixed = self.wallMask.copy()
+        reward[self.wallMask] = 0
+        for coord in self.capsules:
+            self.setFixed(reward, fixed, coord, self.capsuleReward)
+        for coord in self.food:
+            self.setFixed(reward, fixed, coord, self.foodReward)
+        for coord in self.radiusList:
+            self.setFixed(reward, fixed, coord, self.ghostValue(coord) * self.radiusFactor[coord])
+        for coord in self.ghosts:
+            self.setFixed(reward, fixed, coord, self.ghostValue(coord))
+        return reward, fixed
+
+    # Fixes the value of a cell in the arrays built by mapArrays
+    # Ghosts between two cells (scared ghosts move in half steps) are not on any cell
+    def setFixed(self, reward, fixed, coord, value):
+        i = self.index.get(coord)
+        if i != None:
+            reward[i] = value
+            fixed[i] = True
+
+    # Warm start for the dict engine: cells whose reward is unchanged since the last
+    # move start from their converged utility instead of the reward from mapValues
+    # Cells whose reward changed are dirty and start from their new reward
+    def warmMap(self, dictMap):
+        self.dirty = len(dictMap)
+        if not self.warmStart or self.lastUtils == None: return
+        self.dirty = 0
+        for i in self.whole:
+            if dictMap[i] != self.lastRewards[i]: self.dirty += 1
+            else: dictMap[i] = self.lastUtils[i]
+
+    # Warm start for the numpy engine, as warmMap
+    # Returns: array of starting utilities for valueIterationArray
+    def warmArray(self, reward, fixed):
+        self.dirty = len(reward)
+        self.dirtyMask = None
+        if not self.warmStart:
+            return reward
+        if self.lastUtils is not None:
+            lastReward, lastFixed = self.lastRewards
+            dirty = (reward != lastReward) | (fixed != lastFixed)
+            self.dirty = int(dirty.sum())
+            self.dirtyMask = dirty
+            start = np.where(fixed | dirty, reward, self.lastUtils)
+        else:
+            start = reward
+        self.lastRewards = (reward, fixed)
+        return start
+
+    # Array version of valueIteration: each sweep does the Bellman update of every
+    # cell at once, reading the old utilities through the successor arrays
+    # Starts from utils if given, otherwise from the rewards
+    # model is as for expectedArray
+    # Returns: array of converged utilities, indexed like self.whole
+    def valueIterationArray(self, reward, fixed, utils=None, model=None):
+        if utils is None: utils = reward
+        self.sweeps = 0
+        while True:
+            self.sweeps += 1
+            # Expected utility of each of the 4 moves from every cell, shape (4, cells)
+            expected = self.expectedArray(utils, model=model)
+            newUtils = np.where(fixed, reward, self.emptyReward + self.discountFactor * expected.max(axis=0))
+            if self.converged(np.abs(newUtils - utils).max(), newUtils, model):
+                return newUtils
+            utils = newUtils
+
+    # Value iteration over the cells within self.window of pacman only
+    # The cells just outside the window are held at a boundary value: their utility
+    # from the last move if there is one, otherwise the utility of wandering forever
+    # on empty cells, emptyReward / (1 - discount). Cells further away keep the same
+    # boundary value in the result
+    # Returns: array of utilities, indexed like self.whole
+    def windowedValueIteration(self, reward, fixed, utils):
+        inside = list(self.mazeBall(self.index[self.pacman], self.windowRadius(reward)))
+        window = np.zeros(len(self.whole), dtype=bool)
+        window[inside] = True
+        # The window and every cell it can move to
+        cells = np.union1d(inside, self.succ[:, :, inside].ravel())
+        position = np.full(len(self.whole), -1)
+        position[cells] = np.arange(len(cells))
+        # Moves out of the boundary cells are never used, point them at themselves
+        succ = position[self.succ[:, :, cells]]
+        succ = np.where(succ < 0, np.arange(len(cells)), succ)
+        model = (succ, self.succProb[:, :, cells], {self.pacman: position[self.index[self.pacman]]})
+
+        if self.lastUtils is not None: boundary = self.lastUtils
+        else: boundary = np.full(len(self.whole), self.emptyReward / (1 - self.discountFactor))
+        outside = ~window[cells] & ~fixed[cells]
+        localReward = np.where(outside, boundary[cells], reward[cells])
+        localFixed = fixed[cells] | outside
+        local = self.valueIterationArray(localReward, localFixed, np.where(outside, localReward, utils[cells]), model)
+
+        result = np.where(fixed, reward, boundary)
+        result[cells] = local
+        self.updates = self.sweeps * int((window & ~fixed).sum())
+        return result
+
+    # Returns: maze distance from pacman within which cells are solved
+    # 'auto' is the number of steps h after which discount^h * the largest reward
+    # is less than epsilon * (1 - discount)
+    def windowRadius(self, reward):
+        if self.window != 'auto': return self.window
+        largest = max(np.abs(reward).max(), abs(self.emptyReward) / (1 - self.discountFactor))
+        return int(math.ceil(math.log(self.epsilon * (1 - self.discountFactor) / largest) / math.log(self.discountFactor)))
+
+    # Breadth first search over free cells from cell, up to radius steps
+    # Returns: dictionary mapping the cells found, including cell itself, to their
+    # maze distance from cell
+    def mazeBall(self, cell, radius):
+        found = {cell: 0}
+        frontier = [cell]
+        for step in range(radius):
+            nextFrontier = []
+            for i in frontier:
+                for j in self.neighbours[i]:
+                    if j not in found:
+                        found[j] = step + 1
+                        nextFrontier.append(j)
+            frontier = nextFrontier
+        return found
+
+    # Does the full solve the window stands in for, and counts whether it picks the
+    # same move as dictMap, the windowed solve
+    def checkWindow(self, reward, fixed, start, dictMap):
+        sweeps, updates, timedOut = self.sweeps, self.updates, self.timedOut
+        full = self.valueIterationArray(reward, fixed, start)
+        self.sweeps, self.updates, self.timedOut = sweeps, updates, timedOut
+        self.windowChecked += 1
+        if self.findMax(self.pacman, dict(zip(self.whole, full.tolist())))[0] == self.findMax(self.pacman, dictMap)[0]:
+            self.windowAgreed += 1
+
+    # Solves the MDP with the chosen solver, starting from utils
+    # Returns: array of utilities, indexed like self.whole
+    def solveArray(self, reward, fixed, utils):
+        self.updates = None
+        self.coarseSweeps = 0
+        self.coarseUpdates = 0
+        # A cold solve starts from the utilities of the coarser copies of the map
+        if self.multigrid > 0 and self.dirtyMask is None and self.solver != 'horizon':
+            utils = self.multigridStart(reward, fixed)
+        if self.solver == 'prioritized' and self.dirtyMask is not None:
+            utils = self.prioritizedSweeping(reward, fixed, utils)
+        elif self.window:
+            utils = self.windowedValueIteration(reward, fixed, utils)
+        elif self.sweep != 'jacobi':
+            utils = self.gaussSeidelArray(reward, fixed, utils)
+        elif self.solver in ['value', 'prioritized']:
+            utils = self.valueIterationArray(reward, fixed, utils)
+        elif self.solver == 'corridor':
+            utils = self.corridorIteration(reward, fixed, utils)
+        elif self.solver == 'horizon':
+            utils = self.backwardInduction()
+        elif self.solver == 'parallel':
+            utils = self.parallelIteration(reward, fixed, utils)
+        else:
+            utils = self.policyIteration(reward, fixed, utils, self.solver == 'modified')
+        # Full sweeps update every free cell
+        if self.updates == None: self.updates = self.sweeps * int(len(fixed) - fixed.sum())
+        self.sweeps += self.coarseSweeps
+        self.updates += self.coarseUpdates
+        if self.warmStart: self.lastUtils = utils
+        return utils
+
+    # Belief over what pacman cannot see, as arrays over the cells: the chance of
+    # food and of a capsule in each cell, and the expected number of unseen ghosts
+    # in each cell. Cells never seen start at foodPrior, and unseen ghosts could be
+    # anywhere
+    def startBelief(self):
+        self.freeMask = ~self.wallMask
+        self.foodBelief = np.where(self.freeMask, self.foodPrior, 0.0)
+        self.capsuleBelief = np.zeros(len(self.whole))
+        self.ghostBelief = self.freeMask / float(self.freeMask.sum())
+        self.random = np.random.RandomState(0)
+        # Moving a ghost's belief on one move: any way but back, taken as any way
+        self.ghostSpread = [(i, np.array(self.neighbours[i] or [i])) for i in np.flatnonzero(self.freeMask)]
+
+    # Updates the belief with what pacman sees this move. Cells in view hold
+    # exactly what is seen in them, and so does pacman's own cell. Unseen ghosts
+    # spread out by a move, and their belief is scaled to the number of ghosts
+    # that cannot be seen
+    def updateBelief(self, state):
+        view = api.visibleCells(state)
+        if view == None: seen = self.freeMask.copy()
+        else:
+            seen = np.zeros(len(self.whole), dtype=bool)
+            for coord in view + [self.pacman]: seen[self.index[coord]] = True
+        self.foodBelief[seen] = 0
+        self.capsuleBelief[seen] = 0
+        for coord in self.food: self.foodBelief[self.index[coord]] = 1
+        for coord in self.capsules: self.capsuleBelief[self.index[coord]] = 1
+
+        spread = np.zeros(len(self.whole))
+        for i, cells in self.ghostSpread: spread[cells] += self.ghostBelief[i] / len(cells)
+        spread[seen] = 0
+        hidden = self.ghostCount - len(self.ghosts)
+        if hidden > 0 and spread.sum() == 0: spread = np.where(self.freeMask & ~seen, 1.0, 0.0)
+        if spread.sum() > 0: spread *= hidden / spread.sum()
+        self.hiddenBelief = spread
+        self.ghostBelief = spread.copy()
+        for coord in self.ghosts:
+            i = self.index.get((int(coord[0]), int(coord[1])))
+            if i != None: self.ghostBelief[i] += 1
+
+    # QMDP: solves a fully observed map for each of a number of hypotheses drawn
+    # from the belief, and averages their utilities. The expected utility of a move
+    # is linear in the utilities, so findMax on the average is the QMDP move. Each
+    # solve starts from the one before, so later ones take few sweeps
+    # Everything seen is the same in every hypothesis; with nothing unseen only one
+    # is needed
+    # Returns: array of utilities averaged over the hypotheses
+    def qmdp(self, reward, fixed):
+        unsure = ((self.foodBelief > 0) & (self.foodBelief < 1)) | ((self.capsuleBelief > 0) & (self.capsuleBelief < 1))
+        hidden = self.ghostCount - len(self.ghosts)
+        if unsure.any() or hidden > 0: count = self.hypotheses
+        else: count = 1
+        if self.lastUtils is not None: start = self.lastUtils
+        else: start = reward
+        total = np.zeros(len(self.whole))
+        sweeps = 0
+        for h in range(count):
+            hReward, hFixed = reward.copy(), fixed.copy()
+            draw = self.random.random_sample(len(self.whole))
+            for belief, value in [(self.capsuleBelief, self.capsuleReward), (self.foodBelief, self.foodReward)]:
+                present = unsure & ~fixed & (draw < belief)
+                hReward[present], hFixed[present] = value, True
+            if hidden > 0 and self.hiddenBelief.sum() > 0:
+                unseen = self.hiddenBelief / self.hiddenBelief.sum()
+                for i in self.random.choice(len(self.whole), hidden, p=unseen):
+                    hReward[i], hFixed[i] = self.ghostReward, True
+            utils = self.valueIterationArray(hReward, hFixed, np.where(hFixed, hReward, start))
+            sweeps += self.sweeps
+            total += utils
+            start = utils
+        self.sweeps = sweeps
+        self.updates = sweeps * int(len(fixed) - fixed.sum())
+        utils = total / count
+        self.lastUtils = utils
+        return utils
+
+    # Cell categories for the stacked solver, given the same priority as in mapArrays
+    # Returns: array of category codes, and array of the fraction of the ghost value
+    # given to each radius cell
+    def mapCategories(self):
+        codes = np.where(self.wallMask, WALL, EMPTY)
+        factor = np.zeros(len(self.whole))
+        for coords, code in [(self.capsules, CAPSULE), (self.food, FOOD), (self.radiusList, RADIUS), (self.ghosts, GHOST)]:
+            for coord in coords:
+                i = self.index.get(coord)
+                if i != None: codes[i] = code
+                if i != None and code == RADIUS: factor[i] = self.radiusFactor[coord]
+        return codes, factor
+
+    # Value iteration for several parameter settings at once, on the current map
+    # Row k of the utilities is setting k, so each sweep is one array operation over
+    # every setting. Rows are summed in the same order as expectedArray, so each
+    # gives the same utilities as solving its setting alone
+    # A row stops being swept once it meets the stop rule, so settings that converge
+    # quickly do not wait for slow ones; the policy rule is taken as the residual rule
+    # Returns: list of the move each setting makes from pacman's cell, and the
+    # array of utilities, one row per setting
+    def stackedIteration(self, settings):
+        codes, factor = self.mapCategories()
+        fixed = codes != EMPTY
+        timer = 0
+        if self.stateTimes: timer = self.stateTimes[-1][1]      # as ghostValue
+        params = [dict((SETTING_PARAMS[name], setting.get(name, getattr(self, SETTING_PARAMS[name])))
+                       for name in SETTING_PARAMS) for setting in settings]
+        reward = np.empty((len(settings), len(self.whole)))
+        for k, p in enumerate(params):
+            if timer == 0: ghost = p['ghostReward']
+            else: ghost = self.scaredValue(timer)
+            reward[k] = np.array([p['emptyReward'], 0, p['capsuleReward'], p['foodReward'], ghost, ghost], dtype=float)[codes]
+            reward[k][codes == RADIUS] *= factor[codes == RADIUS]
+        emptyReward = np.array([[p['emptyReward']] for p in params])
+        discount = np.array([[p['discountFactor']] for p in params])
+
+        utils = reward.copy()
+        active = np.arange(len(settings))
+        self.sweeps = 0
+        while len(active) > 0 and not self.outOfTime():
+            self.sweeps += 1
+            rows = utils[active]
+            expected = self.succProb[0] * np.take(rows, self.succ[0], axis=1)
+            for k in range(1, len(self.succ)):
+                expected = expected + self.succProb[k] * np.take(rows, self.succ[k], axis=1)
+            newRows = np.where(fixed, reward[active], emptyReward[active] + discount[active] * expected.max(axis=1))
+            residual = np.abs(newRows - rows).max(axis=1)
+            utils[active] = newRows
+            if self.stop == 'exact': active = active[residual != 0]
+            else: active = active[residual > self.epsilon]
+
+        # Moves from pacman's cell, breaking ties as findMax does
+        i = self.index[self.pacman]
+        values = self.succProb[0][:, i] * utils[:, self.succ[0][:, i]]
+        for k in range(1, len(self.succ)):
+            values = values + self.succProb[k][:, i] * utils[:, self.succ[k][:, i]]
+        order = list({Directions.NORTH: 0.0, Directions.SOUTH: 0.0, Directions.EAST: 0.0, Directions.WEST: 0.0})
+        moves = [max(order, key=lambda d: row[ACTIONS.index(d)]) for row in values.tolist()]
+        return moves, utils
+
+    # Sets up the shared arrays and worker processes of the parallel solver
+    # The map is cut into one tile of whole columns per worker, so each tile is a
+    # run of cell numbers, and its cells are coloured like a chess board
+    def startWorkers(self):
+        self.stopWorkers()
+        n = len(self.whole)
+        shared = [multiprocessing.RawArray('d', n) for i in range(3)]
+        self.sharedUtils, self.sharedReward, self.sharedFixed = [np.frombuffer(a) for a in shared]
+        height = self.table.height
+        cells = np.arange(n)
+        colour = (cells // height + cells % height) % 2
+        bounds = np.linspace(0, self.table.width, self.workers + 1).astype(int) * height
+        tiles = []
+        for t in range(self.workers):
+            tile = (cells >= bounds[t]) & (cells < bounds[t + 1]) & ~self.wallMask
+            members = [np.flatnonzero(tile & (colour == c)) for c in (0, 1)]
+            # Indexing the last axis leaves the cells strided apart, copying puts
+            # each row of a tile's columns together
+            tiles.append([(m, np.ascontiguousarray(self.succ[:, :, m]), np.ascontiguousarray(self.succProb[:, :, m]))
+                          for m in members])
+        self.tiles = tiles
+        self.workerArgs = (shared, tiles, self.emptyReward, self.discountFactor)
+        if self.workers > 1: self.pool = multiprocessing.Pool(self.workers, initWorker, self.workerArgs)
+        else: self.pool = None
+        self.poolTable = self.table
+
+    # Red-black value iteration: each sweep updates all the cells of one colour,
+    # tile by tile in the worker processes, then all the cells of the other colour.
+    # The utilities are in shared memory, so the new values along the edges of
+    # each tile are seen by its neighbours from the next half sweep on
+    # Returns: array of converged utilities
+    def parallelIteration(self, reward, fixed, utils):
+        self.sharedReward[:] = reward
+        self.sharedFixed[:] = fixed
+        self.sharedUtils[:] = utils
+        # A single worker runs here, where other agents may have set up their own
+        if self.pool == None: initWorker(*self.workerArgs)
+        jobs = [[(t, c) for t in range(len(self.tiles))] for c in (0, 1)]
+        self.sweeps = 0
+        while True:
+            self.sweeps += 1
+            residual = 0.0
+            for colour in jobs:
+                if self.pool != None: residual = max([residual] + self.pool.map(sweepTile, colour))
+                else: residual = max([residual] + map(sweepTile, colour))
+            if self.converged(residual, self.sharedUtils):
+                return self.sharedUtils.copy()
+
+    # Ends the worker processes of the parallel solver, if there are any. The
+    # next game starts them again
+    def stopWorkers(self):
+        if self.pool != None:
+            self.pool.terminate()
+            self.pool.join()
+        self.pool = None
+        self.poolTable = None
+
+    # Finite horizon solver: utilities of each cell at each of the next horizon moves,
+    # worked out backwards from the last one, which is valued as if nothing moved
+    # again: food and capsules keep their reward, other cells emptyReward forever.
+    # Ghosts are not fixed rewards: at move t a cell is entered with a ghost in it
+    # with the probability that a ghost is there before or after its t-th move, as
+    # predicted by predictGhosts, and is then worth that ghost's value
+    # Each move back is one sweep, so it takes exactly horizon sweeps
+    # Returns: array of the utilities of the cells pacman can move to next
+    def backwardInduction(self):
+        reward = np.full(len(self.whole), float(self.emptyReward))
+        fixed = self.wallMask.copy()
+        reward[self.wallMask] = 0
+        for coord in self.capsules:
+            self.setFixed(reward, fixed, coord, self.capsuleReward)
+        for coord in self.food:
+            self.setFixed(reward, fixed, coord, self.foodReward)
+
+        ghosts = self.predictGhosts(self.horizon)
+        values = [self.scaredValue(timer) for pos, timer in self.stateTimes]
+        utils = np.where(fixed, reward, self.emptyReward / (1 - self.discountFactor))
+        for t in range(self.horizon, 0, -1):
+            moved = np.where(fixed, reward, self.emptyReward + self.discountFactor * self.expectedArray(utils).max(axis=0))
+            # Chance of meeting no ghost, and the value of the ghost met otherwise,
+            # averaged over the ghosts by how likely each is to be there
+            free = np.ones(len(self.whole))
+            chance = np.zeros(len(self.whole))
+            meet = np.zeros(len(self.whole))
+            for g in range(len(ghosts)):
+                p = 1 - (1 - ghosts[g][t - 1]) * (1 - ghosts[g][t])
+                free *= 1 - p
+                chance += p
+                meet += p * values[g]
+            meet = meet / np.maximum(chance, 1e-12)
+            utils = np.where(self.wallMask, 0, free * moved + (1 - free) * meet)
+        self.sweeps = self.horizon
+        return utils
+
+    # Predicts where each ghost will be over the next steps moves with the layout's
+    # GhostTransitionTable, following the game's rules: ghosts never stop, and only
+    # turn back in a dead end. Scared ghosts move at half speed, taken as moving on
+    # half of the moves
+    # Returns: for each ghost, a list over moves 0 to steps of arrays of the
+    # probability of the ghost being in each cell
+    def predictGhosts(self, steps):
+        table = self.ghostTable
+        if self.ghostModel == 'random': moves = [table.moves()] * 2
+        else: moves = [table.moves(self.pacman, scared) for scared in [False, True]]
+        predictions = []
+        for (pos, timer), heading in zip(self.stateTimes, self.ghostHeadings):
+            where = np.zeros(table.states)
+            where[table.state(pos, heading)] = 1
+            cells = [table.cells(where)]
+            for t in range(steps):
+                if timer > t: where = (where + table.step(where, moves[1])) / 2
+                else: where = table.step(where, moves[0])
+                cells.append(table.cells(where))
+            predictions.append(cells)
+        return predictions
+
+    # Arrays over the junction graph of the layout, for the corridor solver
+    def buildGraph(self, state):
+        self.graph = api.corridorGraph(state)
+        self.graphNodes = np.array(self.graph.nodes)
+        position = dict((cell, k) for k, cell in enumerate(self.graph.nodes))
+        self.edgeFrom = np.array([position[node] for node, path in self.graph.edges], dtype=int)
+        self.edgeTo = np.array([position[path[-1]] for node, path in self.graph.edges], dtype=int)
+        self.hasEdges = np.zeros(len(self.graphNodes), dtype=bool)
+        self.hasEdges[self.edgeFrom] = True
+        self.corridorMask = np.zeros(len(self.whole), dtype=bool)
+        self.corridorMask[self.graph.free] = True
+        self.corridorMask[self.graphNodes] = False
+
+    # Value iteration over the junction graph
+    # In a corridor, trying to move on gets pacman one cell further with probability
+    # direcProb and leaves it in place otherwise, so a step along a corridor is worth
+    # step = emptyReward / (1 - discount * stay) and discounts what follows it by
+    # g = discount * direcProb / (1 - discount * stay). Walking a corridor from a node
+    # is then worth a + b * (utility of the node at the other end), where a and b
+    # are worked out once per move: b is 0 if the walk stops at food, a capsule or
+    # a ghost on the way. Sweeps then only update the nodes
+    # The policy stop rule needs the cell model, so it is taken as the residual rule
+    # Rounding can leave the node utilities flipping between two values in the last
+    # bit, so the exact rule also stops once the residual no longer goes down
+    # Returns: array of utilities, indexed like self.whole
+    def corridorIteration(self, reward, fixed, utils):
+        if api.nonDeterministic: stay = 1 - self.direcProb
+        else: stay = 0.0
+        g = self.discountFactor * (1 - stay) / (1 - self.discountFactor * stay)
+        step = self.emptyReward / (1 - self.discountFactor * stay)
+        rewards, fixedList = reward.tolist(), fixed.tolist()
+
+        a, b = [], []
+        for node, path in self.graph.edges:
+            arriveA, arriveB = 0.0, 1.0
+            for cell in reversed(path[:-1]):
+                if fixedList[cell]: arriveA, arriveB = rewards[cell], 0.0
+                else: arriveA, arriveB = step + g * arriveA, g * arriveB
+            a.append(step + g * arriveA)
+            b.append(g * arriveB)
+        a, b = np.array(a), np.array(b)
+
+        nodeReward = reward[self.graphNodes]
+        # A free cell with no free neighbours can only stay where it is
+        nodeReward = np.where(fixed[self.graphNodes] | self.hasEdges, nodeReward, self.emptyReward / (1 - self.discountFactor))
+        nodeFixed = fixed[self.graphNodes] | ~self.hasEdges
+        nodeUtils = np.where(nodeFixed, nodeReward, utils[self.graphNodes])
+        self.sweeps = 0
+        lastResidual = np.inf
+        while True:
+            self.sweeps += 1
+            best = np.full(len(nodeUtils), -np.inf)
+            np.maximum.at(best, self.edgeFrom, a + b * nodeUtils[self.edgeTo])
+            newUtils = np.where(nodeFixed, nodeReward, best)
+            residual = np.abs(newUtils - nodeUtils).max()
+            nodeUtils = newUtils
+            if self.stats: self.residuals.append(residual)
+            if self.stop == 'exact': done = residual == 0 or residual >= lastResidual
+            else: done = residual <= self.epsilon
+            lastResidual = residual
+            if done or self.outOfTime(): break
+
+        # Each corridor cell takes the better of walking to either end
+        result = np.where(fixed, reward, -np.inf)
+        result[self.graphNodes] = nodeUtils
+        ends = result.tolist()
+        for node, path in self.graph.edges:
+            arrive = ends[path[-1]]
+            for cell in reversed(path[:-1]):
+                toward = step + g * arrive
+                if fixedList[cell]: arrive = rewards[cell]
+                else:
+                    if toward > ends[cell]: ends[cell] = toward
+                    arrive = toward
+        result = np.array(ends)
+        self.updates = self.sweeps * int((~nodeFixed).sum()) + int((self.corridorMask & ~fixed).sum())
+        return result
+
+    # Builds the coarser copies of the map used by multigridStart. Cell (x, y) of
+    # each copy is the 2x2 block of cells (2x..2x+1, 2y..2y+1) of the one before,
+    # and is a wall only if all of them are. A move from one block to the next is
+    # possible if a move in that direction is possible from any of its cells to
+    # the other block, and moves go wrong as in api.motionModel
+    # level['parent'][i] is the block that cell i of the copy before falls in
+    # Called once at initialization
+    def buildLevels(self):
+        self.levels = []
+        cells = np.arange(len(self.whole))
+        # Cell reached by each move from each cell, -1 where the move is blocked
+        adjacent = np.where((self.succ[0] != cells) & (self.succProb[0] > 0), self.succ[0], -1)
+        width, height, wall = self.table.width, self.table.height, self.wallMask
+        for level in range(self.multigrid):
+            blockWidth, blockHeight = (width + 1) // 2, (height + 1) // 2
+            size = blockWidth * blockHeight
+            cells = np.arange(width * height)
+            parent = (cells // height // 2) * blockHeight + (cells % height) // 2
+            blockWall = np.ones(size, dtype=bool)
+            np.logical_and.at(blockWall, parent, wall)
+            blockAdjacent = np.full((len(ACTIONS), size), -1)
+            for a in range(len(ACTIONS)):
+                moves = np.flatnonzero(adjacent[a] >= 0)
+                start, end = parent[moves], parent[adjacent[a][moves]]
+                blockAdjacent[a][start[start != end]] = end[start != end]
+            succ, succProb = self.levelModel(blockAdjacent, blockWall)
+            self.levels.append({'parent': parent, 'wall': blockWall, 'succ': succ, 'succProb': succProb,
+                                'steps': 2 ** (level + 1)})
+            adjacent, width, height, wall = blockAdjacent, blockWidth, blockHeight, blockWall
+
+    # Successor arrays, as self.succ and self.succProb, of a coarser copy of the map
+    # given the block each move from each block leads to (-1 where it is blocked)
+    def levelModel(self, adjacent, wall):
+        succ = np.tile(np.arange(len(wall)), (len(self.succ), len(ACTIONS), 1))
+        succProb = np.zeros(succ.shape)
+        for i in np.flatnonzero(~wall):
+            legal = [direc for a, direc in enumerate(ACTIONS) if adjacent[a][i] >= 0]
+            for a, direc in enumerate(ACTIONS):
+                for k, (move, prob) in enumerate(api.motionModel(direc, legal, self.direcProb)):
+                    if move != Directions.STOP: succ[k, a, i] = adjacent[ACTIONS.index(move)][i]
+                    succProb[k, a, i] = prob
+        return succ, succProb
+
+    # Rewards of a coarser copy of the map from those of the copy before. A block
+    # holding any cells of fixed value is fixed at the worst of them if that is
+    # negative (a ghost), and at the best of them otherwise
+    # Returns: array of rewards and boolean array of cells whose value is fixed
+    def coarsenRewards(self, reward, fixed, wall, level):
+        parent = level['parent']
+        size = len(level['wall'])
+        fine = np.flatnonzero(fixed & ~wall)
+        worst = np.zeros(size)
+        np.minimum.at(worst, parent[fine], reward[fine])
+        best = np.zeros(size)
+        np.maximum.at(best, parent[fine], reward[fine])
+        blockFixed = level['wall'].copy()
+        blockFixed[parent[fine]] = True
+        blockReward = np.where(worst < 0, worst, best)
+        blockReward[~blockFixed] = self.emptyReward
+        blockReward[level['wall']] = 0
+        return blockReward, blockFixed
+
+    # Starting utilities for a cold solve from the coarser copies of the map. A
+    # move between blocks of the copy built L-th stands for 2 ** L moves, so is
+    # discounted and charged for as that many. Each copy starts from the utilities
+    # of the copy above it, and as it is only a guess at the utilities of the one
+    # below, is solved only until no utility changes by more than 16 ** L epsilon
+    # Only the free cells not of fixed value take their block's utility, and that
+    # is the utility of an empty cell in the block: a block fixed at a food or ghost
+    # value holds empty cells too, which are worth what a move from it is worth
+    # Returns: array of starting utilities, indexed like self.whole
+    def multigridStart(self, reward, fixed):
+        rewards = [(reward, fixed, self.wallMask)]
+        for level in self.levels:
+            rewards.append(self.coarsenRewards(rewards[-1][0], rewards[-1][1], rewards[-1][2], level)
+                           + (level['wall'],))
+        utils = None
+        for L in reversed(range(len(self.levels))):
+            level = self.levels[L]
+            blockReward, blockFixed, blockWall = rewards[L + 1]
+            if utils is None: utils = blockReward
+            else: utils = np.where(blockFixed, blockReward, empty[self.levels[L + 1]['parent']])
+            empty = utils
+            discount = self.discountFactor ** level['steps']
+            cost = self.emptyReward * sum(self.discountFactor ** k for k in range(level['steps']))
+            while not self.outOfTime():
+                self.coarseSweeps += 1
+                self.coarseUpdates += int((~blockFixed).sum())
+                expected = self.expectedArray(utils, model=(level['succ'], level['succProb']))
+                empty = cost + discount * expected.max(axis=0)
+                newUtils = np.where(blockFixed, blockReward, empty)
+                residual = np.abs(newUtils - utils).max()
+                utils = newUtils
+                if residual <= self.epsilon * 16 ** (L + 1): break
+            empty = np.where(blockWall, 0, empty)
+        return np.where(fixed, reward, empty[self.levels[0]['parent']])
+
+    # Gauss-Seidel sweeps for the numpy engine, as gaussSeidel
+    # Works on python lists like prioritizedSweeping, since each update must see
+    # the one before it
+    # Returns: array of converged utilities
+    def gaussSeidelArray(self, reward, fixed, utils):
+        utils = utils.tolist()
+        backups = self.backups
+        emptyReward, discount = self.emptyReward, self.discountFactor
+        free = np.flatnonzero(~fixed).tolist()
+        if self.sweep == 'ordered':
+            free = self.sweepOrder(np.flatnonzero(fixed & ~self.wallMask).tolist(), free)
+        self.sweeps = 0
+        while True:
+            self.sweeps += 1
+            residual = 0
+            for i in free:
+                # Bellman update, summed in the same order as expectedArray
+                best = None
+                for succ, prob in backups[i]:
+                    value = prob[0] * utils[succ[0]]
+                    for k in range(1, len(succ)):
+                        value += prob[k] * utils[succ[k]]
+                    if best == None or value > best: best = value
+                util = emptyReward + discount * best
+                residual = max(residual, abs(util - utils[i]))
+                utils[i] = util
+            if self.converged(residual, np.array(utils)):
+                return np.array(utils)
+
+    # Prioritized sweeping, starting from the utilities of the last move
+    # The queue starts with the cells whose reward changed and the cells that can
+    # move into them. The cell with the largest Bellman residual is updated first,
+    # after which the cells that can move into it are queued again if their own
+    # residual is now more than epsilon, so updates spread out from what changed
+    # and stop where the change no longer matters
+    # Works on python lists, as single cells are too small for numpy to help
+    # Returns: array of utilities
+    def prioritizedSweeping(self, reward, fixed, utils):
+        utils = utils.tolist()
+        fixed = fixed.tolist()
+        backups = self.backups
+        emptyReward, discount, threshold = self.emptyReward, self.discountFactor, self.epsilon
+
+        # Bellman update of a single cell, summed in the same order as expectedArray
+        def backup(i):
+            best = None
+            for succ, prob in backups[i]:
+                value = prob[0] * utils[succ[0]]
+                for k in range(1, len(succ)):
+                    value += prob[k] * utils[succ[k]]
+                if best == None or value > best: best = value
+            return emptyReward + discount * best
+
+        # Queues a free cell if its residual is over the threshold. Entries are not
+        # removed when a cell is queued again, the old one is skipped when popped
+        queue = []
+        priority = {}
+        def push(i):
+            if fixed[i]: return
+            residual = abs(backup(i) - utils[i])
+            if residual > threshold and residual > priority.get(i, 0):
+                priority[i] = residual
+                heapq.heappush(queue, (-residual, i))
+
+        for i in np.flatnonzero(self.dirtyMask):
+            push(i)
+            for j in self.predecessors[i]: push(j)
+
+        self.sweeps = 0
+        self.updates = 0
+        while queue:
+            residual, i = heapq.heappop(queue)
+            if priority.get(i) != -residual: continue
+            del priority[i]
+            utils[i] = backup(i)
+            self.updates += 1
+            for j in self.predecessors[i]: push(j)
+            if self.updates % 1000 == 0 and self.outOfTime(): break
+        return np.array(utils)
+
+    # Policy iteration over the arrays of the numpy engine
+    # Alternates working out the utilities of the current policy with making the
+    # policy greedy with respect to them, until the policy stops changing
+    # Modified policy iteration only does evalSweeps sweeps of evaluation, and its
+    # greedy step is a full Bellman update, so it stops by self.converged like
+    # value iteration does
+    # Each sweep of evaluation or greedy step counts as one sweep, as does each
+    # direct solve of a policy
+    # Returns: array of utilities of the final policy
+    def policyIteration(self, reward, fixed, utils, modified=False):
+        cells = np.arange(len(utils))
+        free = ~fixed
+        policy = self.expectedArray(utils).argmax(axis=0)
+        self.sweeps = 0
+        while True:
+            if modified: utils = self.evaluatePolicy(reward, fixed, utils, policy, self.evalSweeps)
+            else: utils = self.evaluatePolicy(reward, fixed, utils, policy)
+            self.sweeps += 1
+            expected = self.expectedArray(utils)
+            best = expected.max(axis=0)
+            # Keep the current move unless another is better by more than rounding error,
+            # otherwise ties between moves can make the policy cycle
+            tolerance = 1e-9 * (1 + np.abs(best))
+            newPolicy = np.where(expected[policy, cells] >= best - tolerance, policy, expected.argmax(axis=0))
+            if modified:
+                # Greedy step with the kept moves, so a stable policy is evaluated exactly as above
+                newUtils = np.where(fixed, reward, self.emptyReward + self.discountFactor * expected[newPolicy, cells])
+                if self.converged(np.abs(newUtils - utils).max(), newUtils):
+                    return newUtils
+                utils = newUtils
+            elif np.array_equal(newPolicy[free], policy[free]) or self.outOfTime():
+                return utils
+            policy = newPolicy
+
+    # Works out the utilities of always making the moves given by policy, an array of
+    # indices into ACTIONS
+    # Does the given number of sweeps of Bellman updates with the move fixed by the
+    # policy or, with no number given, sweeps until no utility changes by more than
+    # epsilon. Maps with at most directSolve free cells are solved directly instead
+    # Returns: array of utilities
+    def evaluatePolicy(self, reward, fixed, utils, policy, sweeps=None):
+        cells = np.arange(len(utils))
+        # Transition matrix of the policy, kept sparse as successor and probability arrays
+        succ = self.succ[:, policy, cells]
+        prob = self.succProb[:, policy, cells]
+        if sweeps == None and len(cells) - fixed.sum() <= self.directSolve:
+            self.sweeps += 1
+            return self.solvePolicy(reward, fixed, succ, prob)
+        done = 0
+        while sweeps == None or done < sweeps:
+            done += 1
+            self.sweeps += 1
+            expected = prob[0] * utils[succ[0]]
+            for k in range(1, len(succ)):
+                expected = expected + prob[k] * utils[succ[k]]
+            newUtils = np.where(fixed, reward, self.emptyReward + self.discountFactor * expected)
+            residual = np.abs(newUtils - utils).max()
+            utils = newUtils
+            if (sweeps == None and residual <= self.epsilon) or self.outOfTime():
+                break
+        return utils
+
+    # Solves the linear equations U = emptyReward + discount * P U for the free cells,
+    # where P is the transition matrix of the policy given by succ and prob
+    # Utilities of fixed cells are their rewards and move to the right hand side
+    # Returns: array of utilities
+    def solvePolicy(self, reward, fixed, succ, prob):
+        free = np.flatnonzero(~fixed)
+        position = np.full(len(fixed), -1)
+        position[free] = np.arange(len(free))
+        matrix = np.eye(len(free))
+        rhs = np.full(len(free), float(self.emptyReward))
+        rows = np.arange(len(free))
+        for k in range(len(succ)):
+            target = succ[k][free]
+            weight = self.discountFactor * prob[k][free]
+            toFree = position[target] >= 0
+            np.add.at(matrix, (rows[toFree], position[target[toFree]]), -weight[toFree])
+            rhs += np.where(toFree, 0, weight * reward[target])
+        utils = reward.copy()
+        utils[free] = np.linalg.solve(matrix, rhs)
+        return utils
 
     # Prints the map in the terminal with utility values in empty spaces
     def gridPrint(self, state, map):
@@ -73,6 +73,12 @@ class GameState:
 
     # static variable keeps track of which states have had getLegalActions called
     explored = set()
+
+    # static variable: whether successors share the agent states and capsules
+    # that an action leaves unchanged with their predecessor, rather than
+    # copying them all (see GameStateData). Agents must then not change the
+    # agent states or capsule list of a state they are given
+    copyOnWrite = False
     def getAndResetExplored():
         tmp = GameState.explored.copy()
         GameState.explored = set()
@@ -112,7 +118,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.writableAgentState(agentIndex) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -120,6 +126,7 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
+        state.data.updateZobrist(self.data)
         GameState.explored.add(self)
         GameState.explored.add(state)
         return state
@@ -222,7 +229,7 @@ class GameState:
         Generates a new state by copying information from its predecessor.
         """
         if prevState != None: # Initial state
-            self.data = GameStateData(prevState.data)
+            self.data = GameStateData(prevState.data, GameState.copyOnWrite)
         else:
             self.data = GameStateData()
 
@@ -253,6 +260,97 @@ class GameState:
         """
         self.data.initialize(layout, numGhostAgents)
 
+    def readOnlyView( self ):
+        """
+        Returns a read-only view of this state, for agents that only look at
+        it (see game.Game).
+        """
+        return GameStateView(self)
+
+class GameStateView:
+    """
+    A read-only view of a GameState. It answers every accessor as the state
+    does, without copying the state, and generates successors that are
+    ordinary GameStates.
+
+    Accessors that would hand out the state's own agent states or capsule
+    list hand out copies of them, and the food grid is a copy, which is cheap
+    as grids of food share their cells (see game.BitGrid). Setting attributes
+    or calling initialize raises an AttributeError, and so does changing the
+    data, which is a GameStateDataView.
+    """
+    def __init__( self, state ):
+        self.__dict__['_state'] = state
+        self.__dict__['data'] = GameStateDataView(state.data)
+
+    def __getattr__( self, name ):
+        if name == 'initialize': raise AttributeError("Observations are read-only, so cannot be initialized")
+        return getattr(self._state, name)
+
+    def __setattr__( self, name, value ):
+        raise AttributeError("Observations are read-only, so cannot set " + name)
+
+    def getPacmanState( self ):
+        return self._state.getPacmanState()
+
+    def getGhostStates( self ):
+        return [ghostState.copy() for ghostState in self._state.getGhostStates()]
+
+    def getGhostState( self, agentIndex ):
+        return self._state.getGhostState(agentIndex).copy()
+
+    def getCapsules( self ):
+        return list(self._state.getCapsules())
+
+    def getFood( self ):
+        return self._state.getFood().copy()
+
+    def deepCopy( self ):
+        return self._state.deepCopy()
+
+    def __eq__( self, other ):
+        if isinstance(other, GameStateView): other = other._state
+        return self._state == other
+
+    def __ne__( self, other ):
+        return not self == other
+
+    def __hash__( self ):
+        return hash(self._state)
+
+    def __str__( self ):
+        return str(self._state)
+
+class GameStateDataView:
+    """
+    A read-only view of a GameStateData, as GameStateView.
+    """
+    def __init__( self, data ):
+        self.__dict__['_data'] = data
+
+    def __getattr__( self, name ):
+        value = getattr(self._data, name)
+        if name == 'agentStates': return tuple([agentState.copy() for agentState in value])
+        if name in ['capsules', '_eaten']: return tuple(value)
+        if name == 'food': return value.copy()
+        return value
+
+    def __setattr__( self, name, value ):
+        raise AttributeError("Observations are read-only, so cannot set data." + name)
+
+    def __eq__( self, other ):
+        if isinstance(other, GameStateDataView): other = other._data
+        return self._data == other
+
+    def __ne__( self, other ):
+        return not self == other
+
+    def __hash__( self ):
+        return hash(self._data)
+
+    def __str__( self ):
+        return str(self._data)
+
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
 #                                                                          #
@@ -271,11 +369,12 @@ class ClassicGameRules:
     def __init__(self, timeout=30):
         self.timeout = timeout
 
-    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False):
+    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False,
+                 readOnlyObservations=False):
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
         initState = GameState()
         initState.initialize( layout, len(ghostAgents) )
-        game = Game(agents, display, self, catchExceptions=catchExceptions)
+        game = Game(agents, display, self, catchExceptions=catchExceptions, readOnlyObservations=readOnlyObservations)
         game.state = initState
         self.initialState = initState.deepCopy()
         self.quiet = quiet
@@ -342,7 +441,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.writableAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -364,18 +463,18 @@ class PacmanRules:
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
             state.data._foodEaten = position
-            # TODO: cache numFood?
+            # The food grid is a BitGrid, which keeps count of its food
             numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.writableCapsules().remove( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.writableAgentState(index).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -404,7 +503,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.writableAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -425,12 +524,12 @@ class GhostRules:
                 ghostState = state.data.agentStates[index]
                 ghostPosition = ghostState.configuration.getPosition()
                 if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                    GhostRules.collide( state, ghostState, index )
+                    GhostRules.collide( state, state.data.writableAgentState(index), index )
         else:
             ghostState = state.data.agentStates[agentIndex]
             ghostPosition = ghostState.configuration.getPosition()
             if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                GhostRules.collide( state, ghostState, agentIndex )
+                GhostRules.collide( state, state.data.writableAgentState(agentIndex), agentIndex )
     checkDeath = staticmethod( checkDeath )
 
     def collide( state, ghostState, agentIndex):
@@ -523,6 +622,10 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--copyOnWrite', action='store_true', dest='copyOnWrite',
+                      help='Successor states share what an action leaves unchanged with their predecessor', default=False)
+    parser.add_option('--readOnlyObservations', action='store_true', dest='readOnlyObservations',
+                      help='Give agents read-only views of the game state rather than copies', default=False)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -531,6 +634,7 @@ def readCommand( argv ):
 
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
+    GameState.copyOnWrite = options.copyOnWrite
 
     # Choose a layout
     args['layout'] = layout.getLayout( options.layout )
@@ -570,6 +674,7 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['readOnlyObservations'] = options.readOnlyObservations
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
@@ -625,7 +730,8 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30,
+              readOnlyObservations=False ):
     import __main__
     __main__.__dict__['_display'] = display
 
@@ -642,7 +748,7 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         else:
             gameDisplay = display
             rules.quiet = False
-        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
+        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions, readOnlyObservations)
         game.run()
         if not beQuiet: games.append(game)
 
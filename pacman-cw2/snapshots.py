@@ -0,0 +1,195 @@
+# snapshots.py
+# ------------
+# Records the utilities MDPAgent works out on each move, for looking at
+# after the games are over.
+#
+# Each game is written to two append-only files in a snapshot directory:
+#
+#   game-0000.frames   one frame per move: the utilities, then the
+#                      rewards, of the free cells, as float32
+#   game-0000.moves    one record per move: the move chosen, Pacman's
+#                      cell and the sweeps taken
+#
+# and the directory has a header.json giving the map size and which
+# cells the frames hold. Frames are all the same size, so move k of a
+# game is found without reading the moves before it, and both files
+# are read through np.memmap rather than loaded.
+#
+# The code runs on top of the PacMan AI projects from:
+#
+# http://ai.berkeley.edu/
+#
+# As required by the licensing agreement for the PacMan AI we have:
+#
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+USAGE:      python snapshots.py <directory> [<game> [<move>]]
+EXAMPLES:   (1) python pacman.py -p MDPAgent -a snapshots=runs/medium -l mediumClassic -n 500 -q
+                - records every move of 500 games
+            (2) python snapshots.py runs/medium
+                - lists the games recorded
+            (3) python snapshots.py runs/medium 12 40
+                - prints the utilities of move 40 of game 12
+"""
+
+import os, sys, json, errno
+from game import Directions
+
+# numpy is only needed when snapshots are taken or read
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Moves, in the order their codes are stored
+MOVES = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+
+# One record of a .moves file
+MOVE_RECORD = [('move', 'u1'), ('pacman', '<i4'), ('sweeps', '<i4')]
+
+class SnapshotWriter:
+    """
+    Appends the moves of one game to its files in a snapshot directory.
+    """
+    def __init__(self, directory, width, height, free):
+        """
+        free lists the numbers (x * height + y) of the cells recorded.
+        Writes the directory's header if it is new, and takes the game
+        number after the highest one in it, so earlier runs are never
+        written over. The number is claimed by creating its .moves file,
+        which fails if another writer got there first, in which case the
+        next number is tried.
+        """
+        if not os.path.isdir(directory): os.makedirs(directory)
+        header = {'width': width, 'height': height, 'free': list(free), 'moves': MOVES}
+        path = os.path.join(directory, 'header.json')
+        if os.path.exists(path):
+            if readHeader(directory)['free'] != header['free']:
+                raise Exception("The snapshots in " + directory + " are of a different layout")
+        else:
+            f = open(path, 'w')
+            try: json.dump(header, f)
+            finally: f.close()
+        self.free = np.array(free)
+        games = listGames(directory)
+        if games: self.game = games[-1] + 1
+        else: self.game = 0
+        while True:
+            name = os.path.join(directory, 'game-%04d' % self.game)
+            try: fd = os.open(name + '.moves', os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666)
+            except OSError, e:
+                if e.errno != errno.EEXIST: raise
+                self.game += 1
+                continue
+            break
+        self.moves = os.fdopen(fd, 'ab')
+        self.frames = open(name + '.frames', 'ab')
+
+    def write(self, move, pacman, sweeps, utils, reward):
+        """
+        Appends one move. utils and reward are over every cell of the map,
+        indexed by cell number.
+        """
+        frame = np.empty((2, len(self.free)), dtype='<f4')
+        frame[0] = np.asarray(utils)[self.free]
+        frame[1] = np.asarray(reward)[self.free]
+        self.frames.write(frame.tostring())
+        record = np.array([(MOVES.index(move), pacman, sweeps)], dtype=MOVE_RECORD)
+        self.moves.write(record.tostring())
+
+    def close(self):
+        self.frames.close()
+        self.moves.close()
+
+class GameSnapshots:
+    """
+    The recorded moves of one game, read through memory maps.
+
+    utils[k] and rewards[k] are the arrays of move k over the recorded
+    cells, and moves[k] its record (see MOVE_RECORD). grid(k) gives move
+    k's utilities as a width by height array, with nan for walls.
+    """
+    def __init__(self, directory, game):
+        self.header = readHeader(directory)
+        name = os.path.join(directory, 'game-%04d' % game)
+        cells = len(self.header['free'])
+        self.moves = memmapOrEmpty(name + '.moves', np.dtype(MOVE_RECORD))
+        frames = memmapOrEmpty(name + '.frames', np.dtype('<f4'))
+        # A move that was still being written when the game stopped is left out
+        count = min(len(self.moves), len(frames) // (2 * cells))
+        self.moves = self.moves[:count]
+        frames = frames[:count * 2 * cells].reshape(count, 2, cells)
+        self.utils = frames[:, 0]
+        self.rewards = frames[:, 1]
+
+    def __len__(self):
+        return len(self.moves)
+
+    def grid(self, k, values=None):
+        if values is None: values = self.utils
+        width, height = self.header['width'], self.header['height']
+        out = np.full(width * height, np.nan)
+        out[self.header['free']] = values[k]
+        return out.reshape(width, height)
+
+    def show(self, k):
+        """
+        Prints move k's utilities as a map, top row first, marking
+        Pacman's cell with @.
+        """
+        grid = self.grid(k)
+        pacman = self.moves[k]['pacman']
+        height = self.header['height']
+        print 'Move %d: %s after %d sweeps' % (k, MOVES[self.moves[k]['move']], self.moves[k]['sweeps'])
+        for y in reversed(range(height)):
+            row = ''
+            for x in range(self.header['width']):
+                if x * height + y == pacman: row += '  @  '
+                elif np.isnan(grid[x, y]): row += '[###]'
+                else: row += '%5.2f' % grid[x, y]
+            print row
+
+def memmapOrEmpty(path, dtype):
+    # np.memmap cannot map an empty file
+    if os.path.getsize(path) == 0: return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+def readHeader(directory):
+    f = open(os.path.join(directory, 'header.json'))
+    try: return json.load(f)
+    finally: f.close()
+
+def listGames(directory):
+    """
+    Returns the numbers of the games recorded in a directory.
+    """
+    return sorted([int(name[len('game-'):-len('.moves')]) for name in os.listdir(directory)
+                   if name.startswith('game-') and name.endswith('.moves')])
+
+def loadGame(directory, game):
+    """
+    Returns the GameSnapshots of a recorded game.
+    """
+    return GameSnapshots(directory, game)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2: sys.exit(__doc__)
+    directory = sys.argv[1]
+    if len(sys.argv) == 2:
+        for game in listGames(directory):
+            print 'game %d: %d moves' % (game, len(loadGame(directory, game)))
+    else:
+        snapshots = loadGame(directory, int(sys.argv[2]))
+        if len(sys.argv) > 3: snapshots.show(int(sys.argv[3]))
+        else:
+            for k in range(len(snapshots)): snapshots.show(k)
@@ -0,0 +1,154 @@
+# solvecache.py
+# -------------
+# A cache of converged utilities kept on disk, so that games played one
+# after another, or at the same time by separate processes, share the
+# solves of situations any of them has seen before.
+#
+# Each entry is one .npy file in the cache directory, named by the sha1
+# of its key. Entries are written under a temporary name and renamed into
+# place, which is atomic, so a reader sees either the whole entry or none
+# of it and no locking is needed. Entries are read through np.load with
+# mmap_mode='r', so only the pages used are read in. When the directory
+# grows past its size limit the entries used least recently are deleted,
+# down to a little under the limit so that the next few writes do not
+# each have to scan the directory again.
+#
+# The code runs on top of the PacMan AI projects from:
+#
+# http://ai.berkeley.edu/
+#
+# As required by the licensing agreement for the PacMan AI we have:
+#
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+USAGE:      python solvecache.py <directory> [clear]
+EXAMPLES:   (1) python pacman.py -p MDPAgent -a engine=numpy,solveCache=runs/cache -l mediumClassic -n 500 -q
+                - solves each situation once over all 500 games
+            (2) python solvecache.py runs/cache
+                - prints how many entries the cache holds and their size
+            (3) python solvecache.py runs/cache clear
+                - deletes every entry
+"""
+
+import os, sys, hashlib
+
+# numpy is only needed when the cache is used
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Extension of entry files
+SUFFIX = '.npy'
+
+# Fraction of the limit that eviction brings the cache down to
+LOW_WATER = 0.9
+
+def digest(key):
+    """
+    Returns the name, a sha1 in hex, of the entry for a key. The key may be
+    anything whose repr is the same in every process, such as tuples of
+    numbers and strings.
+    """
+    return hashlib.sha1(repr(key)).hexdigest()
+
+class SolveCache:
+    """
+    Converged utility arrays on disk, by key, holding at most limit bytes.
+    """
+    def __init__(self, directory, limit):
+        if not os.path.isdir(directory):
+            try: os.makedirs(directory)
+            except OSError:
+                # Another process may have made it first
+                if not os.path.isdir(directory): raise
+        self.directory = directory
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        # Bytes in the directory, as last counted plus what this process has
+        # written since. Other processes write too, so it is counted again
+        # before anything is evicted
+        self.bytes = sum([size for name, size, used in self.entries()])
+
+    def path(self, key):
+        return os.path.join(self.directory, digest(key) + SUFFIX)
+
+    def get(self, key):
+        """
+        Returns the array stored for key, as a read-only memory map, or None
+        if there is none.
+        """
+        path = self.path(key)
+        try:
+            utils = np.load(path, mmap_mode='r')
+            # Marks the entry as used, for eviction
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            # Not there, or evicted by another process since it was written
+            self.misses += 1
+            return None
+        self.hits += 1
+        return utils
+
+    def put(self, key, utils):
+        """
+        Stores the array for key, then evicts entries if the cache has grown
+        past its limit. A key already stored is written over with the same
+        array.
+        """
+        path = self.path(key)
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        f = open(temporary, 'wb')
+        try: np.save(f, np.asarray(utils))
+        finally: f.close()
+        os.rename(temporary, path)
+        self.bytes += os.path.getsize(path)
+        if self.bytes > self.limit: self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in
+        LOW_WATER of its limit.
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.bytes = sum([size for name, size, used in entries])
+        for name, size, used in entries:
+            if self.bytes <= self.limit * LOW_WATER: break
+            try: os.remove(os.path.join(self.directory, name))
+            except OSError: pass    # Already evicted by another process
+            self.bytes -= size
+
+    def entries(self):
+        """
+        Returns a (file name, bytes, last used) triple for each entry.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX): continue
+            try: info = os.stat(os.path.join(self.directory, name))
+            except OSError: continue
+            entries.append((name, info.st_size, info.st_mtime))
+        return entries
+
+    def clear(self):
+        self.limit, limit = 0, self.limit
+        self.evict()
+        self.limit = limit
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2: sys.exit(__doc__)
+    cache = SolveCache(sys.argv[1], 0)
+    if len(sys.argv) > 2 and sys.argv[2] == 'clear': cache.clear()
+    entries = cache.entries()
+    print '%d entries, %.0f KB' % (len(entries), sum([size for name, size, used in entries]) / 1024.0)